@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_clients = {}
+_stats = {}
+_api_keys = {}
+
+
+def read_api_key(key_file):
+    if key_file not in _api_keys:
+        with open(os.path.join('api_keys', key_file), 'r') as file:
+            _api_keys[key_file] = file.read().strip()
+    return _api_keys[key_file]
+
+
+def get_registry_key(config, api_key):
+    return config.NAME, hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def get_ai_client(config):
+    api_key = read_api_key(config.KEY_FILE)
+    registry_key = get_registry_key(config, api_key)
+    with _lock:
+        if registry_key not in _clients:
+            _clients[registry_key] = config.create_client(api_key)
+            _stats[registry_key] = {'created_at': time.time(), 'requests': 0, 'failures': 0,
+                                    'consecutive_failures': 0, 'last_error': None}
+            logging.info(f"Created pooled {config.NAME} client.")
+        return _clients[registry_key]
+
+
+def report_success(config):
+    with _lock:
+        for registry_key in _clients:
+            if registry_key[0] == config.NAME:
+                _stats[registry_key]['requests'] += 1
+                _stats[registry_key]['consecutive_failures'] = 0
+
+
+def report_failure(config, error, max_consecutive_failures):
+    with _lock:
+        registry_keys = [registry_key for registry_key in _clients if registry_key[0] == config.NAME]
+        for registry_key in registry_keys:
+            stats = _stats[registry_key]
+            stats['requests'] += 1
+            stats['failures'] += 1
+            stats['consecutive_failures'] += 1
+            stats['last_error'] = repr(error)
+        unhealthy = any(_stats[registry_key]['consecutive_failures'] >= max_consecutive_failures
+                        for registry_key in registry_keys)
+    if unhealthy:
+        logging.warning(f"{config.NAME} client failed {max_consecutive_failures} times in a row, resetting it.")
+        reset_ai_clients(config)
+
+
+def reset_ai_clients(config=None):
+    with _lock:
+        registry_keys = [registry_key for registry_key in _clients
+                         if config is None or registry_key[0] == config.NAME]
+        clients = [_clients.pop(registry_key) for registry_key in registry_keys]
+        for registry_key in registry_keys:
+            del _stats[registry_key]
+        if config is None:
+            _api_keys.clear()
+        else:
+            _api_keys.pop(config.KEY_FILE, None)
+
+    for client in clients:
+        close = getattr(client, 'close', None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                logging.debug(f"Closing AI client failed: {e}")
+
+
+def get_client_health():
+    with _lock:
+        return {f'{name}:{key_hash}': dict(stats) for (name, key_hash), stats in _stats.items()}
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from constants import JobSettings
+import job_checkpoints
+
+_executor = ThreadPoolExecutor(max_workers=JobSettings.MAX_WORKERS, thread_name_prefix='ai-job')
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class AIJob:
+    """State of one background AI run, shared between the worker thread and polling sessions."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = 'running'
+        self.stage = 'queued'
+        self.partial_merchants = {}
+        self.partial_categories = {}
+        self.version = 0
+        self.result = None
+        self.error = None
+        self.args = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def set_stage(self, stage):
+        self.stage = stage
+
+    def add_merchants(self, merchants):
+        with self.lock:
+            self.partial_merchants.update(merchants)
+            self.version += 1
+
+    def add_categories(self, categories):
+        with self.lock:
+            self.partial_categories.update(categories)
+            self.version += 1
+
+    def get_partial_results(self):
+        with self.lock:
+            return self.version, dict(self.partial_merchants), dict(self.partial_categories)
+
+    def finish(self, result):
+        self.result = result
+        self.args = None
+        self.finished_at = time.time()
+        self.status = 'done'
+
+    def fail(self, error):
+        self.error = error
+        self.finished_at = time.time()
+        self.status = 'failed'
+
+
+def get_job_id(df, ai_config, categories):
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(f'{ai_config.NAME}|{",".join(sorted(map(str, categories)))}'.encode())
+    return digest.hexdigest()[:16]
+
+
+def get_job_dir(job_id):
+    job_dir = os.path.join(JobSettings.JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    return job_dir
+
+
+def save_result(job_id, result):
+    job_dir = get_job_dir(job_id)
+    df, merchants_summary_df, template_hits = result
+    df.to_pickle(os.path.join(job_dir, 'result_df.pkl'))
+    merchants_summary_df.to_pickle(os.path.join(job_dir, 'merchants_summary_df.pkl'))
+    with open(os.path.join(job_dir, 'template_hits.json'), 'w') as f:
+        json.dump(template_hits, f)
+
+
+def load_result(job_id):
+    job_dir = os.path.join(JobSettings.JOBS_DIR, job_id)
+    paths = [os.path.join(job_dir, name) for name in
+             ('result_df.pkl', 'merchants_summary_df.pkl', 'template_hits.json')]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    with open(paths[2], 'r') as f:
+        template_hits = tuple(json.load(f))
+    return pd.read_pickle(paths[0]), pd.read_pickle(paths[1]), template_hits
+
+
+def run_job(job, pipeline, df, ai_config, categories):
+    store = job_checkpoints.CheckpointStore(os.path.join(get_job_dir(job.job_id), 'responses.jsonl'))
+    job_checkpoints.activate(store)
+    try:
+        df, merchants_summary_df, _, template_hits = pipeline(df.copy(), ai_config, categories,
+                                                              on_stage=job.set_stage,
+                                                              on_merchants=job.add_merchants,
+                                                              on_categories=job.add_categories)
+        result = (df, merchants_summary_df, template_hits)
+        save_result(job.job_id, result)
+        job.finish(result)
+        logging.info(f"AI job {job.job_id} finished.")
+    except Exception as e:
+        logging.exception(f"AI job {job.job_id} failed.")
+        job.fail(e)
+    finally:
+        job_checkpoints.deactivate()
+
+
+def expire_jobs():
+    cutoff = time.time() - JobSettings.MAX_AGE_SECONDS
+    with _jobs_lock:
+        for job_id, job in list(_jobs.items()):
+            if job.status != 'running' and job.finished_at < cutoff:
+                del _jobs[job_id]
+        active_ids = set(_jobs)
+
+    if not os.path.isdir(JobSettings.JOBS_DIR):
+        return
+    for job_id in os.listdir(JobSettings.JOBS_DIR):
+        job_dir = os.path.join(JobSettings.JOBS_DIR, job_id)
+        if job_id not in active_ids and os.path.getmtime(job_dir) < cutoff:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            logging.info(f"Removed expired AI job directory {job_id}.")
+
+
+def submit_ai_job(df, ai_config, categories, pipeline):
+    expire_jobs()
+    job_id = get_job_id(df, ai_config, categories)
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.status != 'failed':
+            return job_id
+
+        job = AIJob(job_id)
+        _jobs[job_id] = job
+        result = load_result(job_id)
+        if result is not None:
+            job.finish(result)
+        else:
+            job.args = (pipeline, df.copy(), ai_config, categories)
+            _executor.submit(run_job, job, *job.args)
+    return job_id
+
+
+def retry_ai_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or job.status != 'failed' or job.args is None:
+            return
+        job.status, job.stage, job.error = 'running', 'queued', None
+        _executor.submit(run_job, job, *job.args)
+
+
+def release_job(job_id):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
@@ -1,6 +1,3 @@
-import streamlit as st
-
-
 def get_column_names_query(names):
     query = (f"For the following column names, output a dictionary with the keys 'amount', 'date', and 'text'. "
              f"The values should be the closest matching column name, even if the key is the same as a column name. "
@@ -30,9 +27,35 @@ def get_standardize_merchants_query(chunk):
     return query
 
 
-def get_categories_query(chunk):
-    query = (f'possible expenses categories: {",".join(st.session_state.categories)} .\n'
+def get_categories_query(chunk, categories):
+    query = (f'possible expenses categories: {",".join(categories)} .\n'
              f'add the missing categories to table based on merchant and the average amount spend/gained. ' 
              f'If you are not 90% sure,leave empty. Answer only with the table with {len(chunk.split('\n'))-2} rows. '
              f'no explanation: \n\n{chunk}')
     return query
+
+
+def get_compact_merchants_query(rows):
+    query = ('Find the final merchant of each bank transaction - the business actually paid, not a payment '
+             'gateway or intermediary like PayPal, unless no other merchant is named. '
+             'Keep the core merchant name only, without transaction identifiers. '
+             'Input lines are id|transaction text. Answer with one line per id: id|merchant. No other text.'
+             f'\n\n{rows}')
+    return query
+
+
+def get_compact_standardize_merchants_query(rows):
+    query = ('Correct each merchant to the actual short business name (e.g. the restaurant name), '
+             "don't rely on common keywords. "
+             'Input lines are id|merchant. Answer only for merchants that need a change: id|name. No other text.'
+             f'\n\n{rows}')
+    return query
+
+
+def get_compact_categories_query(rows, categories):
+    query = (f'Possible expense categories: {",".join(categories)}\n'
+             'Assign each merchant one of these categories based on its name and average amount '
+             '(negative = spent, positive = gained). If you are not 90% sure, leave it empty. '
+             'Input lines are id|merchant|average amount. Answer with one line per id: id|category. No other text.'
+             f'\n\n{rows}')
+    return query
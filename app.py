@@ -1,3 +1,6 @@
+import time
+start_time = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
 import utils
@@ -6,42 +9,60 @@ from preprocess_merchants_categories import add_merchants_and_categories
 import utils_io
 import sidebar
 import display_data
-from settings import set_logger, set_st, set_footer, get_ai_config
+import incremental_import
+import profiling
+import session_data
+import transaction_store
+import merchant_index
+from constants import StoreSettings
+from settings import set_logger, set_st, set_footer, get_ai_config, log_startup_time
 
 
 logger = set_logger()
+log_startup_time('imports', start_time)
+profiling.start_rerun()
 ai_config = get_ai_config("genai")
-ai_client = ai_config.set_client()
 
 set_st()
+log_startup_time('first_paint', start_time)
 if 'current_df' in st.session_state:
     df = st.session_state.current_df
+elif StoreSettings.ENABLED and transaction_store.count_transactions():
+    df = transaction_store.restore_session()
 else:
     df = pd.DataFrame()
     all_dfs = utils_io.upload_csvs_to_dfs()
 
     if all_dfs:
         placeholder = st.empty()
-        valid_dfs = preprocess_df.format_columns_all_dfs(all_dfs, placeholder.container, ai_config, ai_client)
+        valid_dfs, fingerprints = preprocess_df.format_columns_all_dfs(all_dfs, placeholder.container, ai_config)
         if len(valid_dfs) == len(all_dfs):
             placeholder.empty()
-            df = preprocess_df.concatenate_dfs(valid_dfs)
+            df, fingerprints = preprocess_df.drop_duplicate_rows(preprocess_df.concatenate_dfs(valid_dfs), fingerprints)
+            incremental_import.record_fingerprints([fingerprints], replace=True)
             st.session_state.current_df = df
+            st.session_state.all_dfs = []
+            merchant_index.build_merchant_index(df)
+            utils.bump_data_version()
 
 utils.add_categories_to_session_state(df)
-#
+
 if not df.empty and 'categories' in st.session_state:
-    df, merchants_summary_df = add_merchants_and_categories(df, ai_config, ai_client)
+    df = add_merchants_and_categories(df, ai_config)
     # df = utils_df.delete_rows(df, to_del_substr_l)
-    st.write("You can edit your table here:")
 
-    date_filtered_df = sidebar.apply_date_filter(df)
-    if not date_filtered_df.empty:
-        selected_categories, categories = sidebar.manage_sidebar_categories(df)
-        date_and_categories_filtered_df = sidebar.apply_category_filter(date_filtered_df, selected_categories)
+    if 'is_ran_ai' in st.session_state and 'ai_job_id' not in st.session_state:
+        incremental_import.import_new_statements(ai_config)
 
-        display_data.display_data(date_and_categories_filtered_df, df)
-    else:
-        st.write("No valid data to display.")
+    sidebar.display_search()
+    sidebar.display_date_filter(df)
+    sidebar.manage_sidebar_categories(df)
+    sidebar.display_store_controls()
+    sidebar.display_memory_stats(session_data.enforce_memory_budget())
+    sidebar.display_ai_client_health()
+    display_data.display_dashboard()
 
     set_footer()
+
+profiling.display_profiling()
+profiling.end_rerun()
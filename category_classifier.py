@@ -0,0 +1,130 @@
+import logging
+import numpy as np
+import pandas as pd
+from constants import ColumnNames, ClassifierSettings
+import utils
+import profiling
+
+
+def get_merchant_docs(df):
+    docs = df.groupby(ColumnNames.MERCHANT, sort=False).agg(
+        text=(ColumnNames.TEXT, 'first'),
+        avg_amount=(ColumnNames.AMOUNT, 'mean')).reset_index()
+    return docs
+
+
+def get_char_ngrams(strings, n=ClassifierSettings.NGRAM_SIZE):
+    padded = ' ' + strings.fillna('').astype(str).str.lower().str.strip().str[:ClassifierSettings.MAX_CHARS] + ' '
+    return utils.get_char_ngrams(padded, n, ClassifierSettings.MAX_CHARS + 2)
+
+
+def get_token_keys(doc_ids, tokens, prefix):
+    keys = pd.util.hash_array((prefix + pd.Series(tokens, dtype=object)).to_numpy()).view(np.int64)
+    return doc_ids, keys
+
+
+def get_word_tokens(strings):
+    words = strings.fillna('').astype(str).str.lower().str.findall(r'[^\W\d_]{3,}').explode().dropna()
+    return get_token_keys(words.index.to_numpy(), words.to_numpy(), 'w:')
+
+
+def get_amount_tokens(amounts):
+    amounts = pd.to_numeric(amounts, errors='coerce').fillna(0).to_numpy()
+    buckets = np.floor(np.log10(np.abs(amounts) + 1)).astype(int).astype(str)
+    signs = np.where(amounts < 0, '-', '+')
+    return get_token_keys(np.arange(len(amounts)), np.char.add(signs, buckets), 'a:')
+
+
+def get_doc_terms(docs):
+    docs = docs.reset_index(drop=True)
+    parts = [get_char_ngrams(docs[ColumnNames.MERCHANT]),
+             get_word_tokens(docs['text']),
+             get_amount_tokens(docs['avg_amount'])]
+    doc_ids = np.concatenate([ids for ids, _ in parts])
+    terms = np.concatenate([keys for _, keys in parts])
+    return doc_ids, terms
+
+
+def get_tfidf_weights(doc_ids, term_ids, idf, num_docs):
+    weights = idf[term_ids]
+    norms = np.sqrt(np.bincount(doc_ids, weights=weights ** 2, minlength=num_docs))
+    norms[norms == 0] = 1
+    return weights / norms[doc_ids]
+
+
+def train_classifier(docs):
+    doc_ids, terms = get_doc_terms(docs)
+    term_ids, vocab = pd.factorize(terms)
+    label_ids, labels = pd.factorize(docs[ColumnNames.CATEGORY].reset_index(drop=True))
+    num_docs, num_terms, num_labels = len(docs), len(vocab), len(labels)
+
+    doc_term = pd.unique(doc_ids.astype(np.int64) * num_terms + term_ids)
+    doc_freq = np.bincount(doc_term % num_terms, minlength=num_terms)
+    idf = np.log((1 + num_docs) / (1 + doc_freq)) + 1
+
+    weights = get_tfidf_weights(doc_ids, term_ids, idf, num_docs)
+    centroids = np.bincount(label_ids[doc_ids] * num_terms + term_ids, weights=weights,
+                            minlength=num_labels * num_terms).reshape(num_labels, num_terms)
+    centroid_norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    centroid_norms[centroid_norms == 0] = 1
+
+    return {'vocab': pd.Index(vocab), 'idf': idf, 'centroids': centroids / centroid_norms, 'labels': labels}
+
+
+def predict_categories(model, docs):
+    doc_ids, terms = get_doc_terms(docs)
+    term_ids = model['vocab'].get_indexer(terms)
+    known = term_ids >= 0
+    doc_ids, term_ids = doc_ids[known], term_ids[known]
+    weights = get_tfidf_weights(doc_ids, term_ids, model['idf'], len(docs))
+
+    scores = np.column_stack([np.bincount(doc_ids, weights=centroid[term_ids] * weights, minlength=len(docs))
+                              for centroid in model['centroids']])
+    ranked = np.sort(scores, axis=1)
+    best = ranked[:, -1]
+    margin = best - ranked[:, -2] if scores.shape[1] > 1 else best
+
+    predictions = pd.DataFrame({ColumnNames.CATEGORY: model['labels'][scores.argmax(axis=1)],
+                                'confidence': best,
+                                'margin': margin})
+    return predictions
+
+
+def get_confident_categories(train_docs, test_docs):
+    if (len(train_docs) < ClassifierSettings.MIN_LABELLED_MERCHANTS
+            or train_docs[ColumnNames.CATEGORY].nunique() < 2 or test_docs.empty):
+        return pd.Series(dtype=object)
+
+    model = train_classifier(train_docs)
+    predictions = predict_categories(model, test_docs)
+    confident = ((predictions['confidence'] >= ClassifierSettings.MIN_SIMILARITY) &
+                 (predictions['margin'] >= ClassifierSettings.MIN_MARGIN)).to_numpy()
+    return pd.Series(predictions.loc[confident, ColumnNames.CATEGORY].to_numpy(), index=test_docs.index[confident])
+
+
+def add_history_docs(train_docs, history_docs):
+    if history_docs is None or history_docs.empty:
+        return train_docs
+    if train_docs.empty:
+        return history_docs.reset_index(drop=True)
+    history_docs = history_docs[~history_docs[ColumnNames.MERCHANT].isin(train_docs[ColumnNames.MERCHANT])]
+    return pd.concat([train_docs, history_docs], ignore_index=True)
+
+
+@profiling.timed
+def fill_confident_categories(df, merchants_summary_df, history_docs=None):
+    mask = utils.get_df_mask(merchants_summary_df, ColumnNames.CATEGORY)
+    if not mask.any():
+        return merchants_summary_df
+
+    docs = get_merchant_docs(df)
+    labelled = merchants_summary_df.loc[~mask, [ColumnNames.MERCHANT, ColumnNames.CATEGORY]]
+    train_docs = add_history_docs(docs.merge(labelled, on=ColumnNames.MERCHANT), history_docs)
+    unlabelled = merchants_summary_df.loc[mask, [ColumnNames.MERCHANT]]
+    test_docs = unlabelled.merge(docs, on=ColumnNames.MERCHANT, how='left').set_index(unlabelled.index)
+
+    confident = get_confident_categories(train_docs, test_docs)
+    merchants_summary_df.loc[confident.index, ColumnNames.CATEGORY] = confident.to_numpy()
+
+    logging.info(f"Local classifier filled {len(confident)} of {len(unlabelled)} uncategorized merchants.")
+    return merchants_summary_df
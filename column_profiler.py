@@ -0,0 +1,89 @@
+import logging
+import numpy as np
+import pandas as pd
+from constants import ColumnNames, Globals, ProfilerSettings
+
+
+def get_sample(column):
+    values = column.dropna()
+    if len(values) > ProfilerSettings.SAMPLE_ROWS:
+        values = values.sample(ProfilerSettings.SAMPLE_ROWS, random_state=0)
+    values = values.astype(str).str.strip()
+    return values[values != '']
+
+
+def get_date_rate(values):
+    if values.empty:
+        return 0.0
+    return max(pd.to_datetime(values, format=date_format, errors='coerce').notna().mean()
+               for date_format in Globals.INPUT_DATE_FORMATS)
+
+
+def parse_numbers(values):
+    cleaned = values.str.replace(ProfilerSettings.CURRENCY_PATTERN, '', regex=True)
+    dot_decimal = pd.to_numeric(cleaned.str.replace(',', '', regex=False), errors='coerce')
+    comma_decimal = pd.to_numeric(cleaned.str.replace('.', '', regex=False).str.replace(',', '.', regex=False),
+                                  errors='coerce')
+    return dot_decimal if dot_decimal.notna().sum() >= comma_decimal.notna().sum() else comma_decimal
+
+
+def get_amount_shape(values):
+    return values.str.contains(r'[.,]\d{1,2}$|^-', regex=True).mean() if not values.empty else 0.0
+
+
+def get_text_diversity(values):
+    if len(values) < 2:
+        return float(len(values))
+    frequencies = values.value_counts(normalize=True).to_numpy()
+    return float(-(frequencies * np.log(frequencies)).sum() / np.log(len(values)))
+
+
+def profile_column(column):
+    values = get_sample(column)
+    if values.empty:
+        return {ColumnNames.DATE: 0.0, ColumnNames.AMOUNT: 0.0, ColumnNames.TEXT: 0.0}
+
+    date_rate = get_date_rate(values)
+    numeric_rate = parse_numbers(values).notna().mean()
+    length_factor = min(values.str.len().mean() / ProfilerSettings.TEXT_MIN_LENGTH, 1.0)
+    return {ColumnNames.DATE: date_rate,
+            ColumnNames.AMOUNT: numeric_rate * (1 - date_rate) * (0.5 + 0.5 * get_amount_shape(values)),
+            ColumnNames.TEXT: (1 - numeric_rate) * (1 - date_rate) * get_text_diversity(values) * length_factor}
+
+
+def detect_columns(df):
+    reserved = set(ColumnNames.as_list())
+    missing_roles = [role for role in ColumnNames.initial_columns_as_list() if role not in df.columns]
+    positions = [i for i, column in enumerate(df.columns) if column not in reserved]
+    scores = pd.DataFrame([profile_column(df.iloc[:, i]) for i in positions], index=positions)
+    if not positions:
+        logging.info("Column profiler found no candidate columns.")
+        return {}, {role: 0.0 for role in missing_roles}, False
+
+    mapping, confidences = {}, {}
+    for role in missing_roles:
+        if role not in scores.columns:
+            confidences[role] = 0.0
+            continue
+        candidates = scores.loc[~scores.index.isin(list(mapping)), role].sort_values(ascending=False)
+        if candidates.empty:
+            confidences[role] = 0.0
+            continue
+        best = candidates.iloc[0]
+        runner_up = candidates.iloc[1] if len(candidates) > 1 else 0.0
+        mapping[candidates.index[0]] = role
+        confidences[role] = best if best >= ProfilerSettings.MIN_SCORE else 0.0
+        confidences[role] = min(confidences[role], best - runner_up)
+
+    is_confident = all(confidence >= ProfilerSettings.MIN_MARGIN for confidence in confidences.values())
+    logging.info(f"Column profiler picked {mapping} with confidences {confidences}.")
+    return mapping, confidences, is_confident
+
+
+def rename_detected_columns(df, mapping):
+    columns = list(df.columns)
+    for position, role in mapping.items():
+        columns[position] = role
+    df = df.copy()
+    df.columns = columns
+    return df
@@ -37,6 +37,18 @@ class PlotSettings:
         "#DC143C", "#0000FF", "#006400", "#FF8C00",
         "#9400D3", "#FF1493", "#00CED1", "#FF0000"
     ]
+    GRANULARITIES = ['auto', 'week', 'month', 'quarter', 'year']
+    GRANULARITY_FREQS = {'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+    GRANULARITY_MAX_DAYS = {'week': 120, 'month': 3 * 365, 'quarter': 10 * 365}
+    MAX_BAR_TEXT_LABELS = 120
+    MAX_TOTAL_LABELS = 60
+    MAX_FIGURE_BYTES = 1_000_000
+    BAR_HEIGHT = 600
+    PIE_HEIGHT = 800
+    SUNBURST_HEIGHT = 800
+    SUNBURST_TOP_N = 10
+    OTHER_LABEL = 'Other'
+    FIGURE_CACHE_VIEWS = 8
 
 
 class Colors:
@@ -51,3 +63,113 @@ class Globals:
                           '%d.%m.%Y', '%Y.%m.%d', '%d %b %Y', '%d %B %Y']
     LOG_AI_PATH = os.path.join('logs', 'ai.log')
     MERCHANTS_MAX_WORDS = 7
+    MERCHANT_TEMPLATES_PATH = os.path.join('logs', 'merchant_templates.json')
+    FINGERPRINT_COLUMN = 'fingerprint'
+
+
+class ClassifierSettings:
+    NGRAM_SIZE = 3
+    MAX_CHARS = 40
+    MIN_LABELLED_MERCHANTS = 10
+    MIN_SIMILARITY = 0.35
+    MIN_MARGIN = 0.1
+
+
+class ExtractorSettings:
+    MIN_SUPPORT = 3
+    MIN_PRECISION = 0.9
+
+
+class ExportSettings:
+    CHUNK_ROWS = 50000
+    FILE_NAME = 'expenses_formated'
+    FORMATS = {
+        'CSV': ('csv', 'text/csv'),
+        'Compressed CSV': ('csv.gz', 'application/gzip'),
+        'Parquet': ('parquet', 'application/octet-stream'),
+    }
+
+
+class MemorySettings:
+    SESSION_BUDGET_MB = 512
+    SESSION_TTL_SECONDS = 6 * 60 * 60
+
+
+class AIClientSettings:
+    MAX_CONNECTIONS = 20
+    MAX_KEEPALIVE_CONNECTIONS = 10
+    KEEPALIVE_EXPIRY_SECONDS = 120
+    TIMEOUT_SECONDS = 60
+    CONNECT_TIMEOUT_SECONDS = 10
+    MAX_RETRIES = 2
+    MAX_CONSECUTIVE_FAILURES = 3
+
+
+class JobSettings:
+    JOBS_DIR = os.path.join('logs', 'jobs')
+    MAX_WORKERS = 2
+    POLL_SECONDS = 3
+    MAX_AGE_SECONDS = 24 * 60 * 60
+
+
+class RecurringSettings:
+    PERIOD_DAYS = {'weekly': 7, 'monthly': 30.44, 'yearly': 365.25}
+    TOLERANCE_DAYS = {'weekly': 1, 'monthly': 4, 'yearly': 15}
+    PERIOD_OFFSETS = {'weekly': {'weeks': 1}, 'monthly': {'months': 1}, 'yearly': {'years': 1}}
+    MONTHLY_FACTORS = {'weekly': 52 / 12, 'monthly': 1, 'yearly': 1 / 12}
+    MIN_OCCURRENCES = 3
+    MIN_PERIODICITY = 0.75
+    MIN_AMOUNT_STABILITY = 0.8
+
+
+class StoreSettings:
+    # Single local database shared by every session - only enable for a single-user install.
+    ENABLED = False
+    DB_PATH = os.path.join('db', 'transactions.db')
+    SQL_DATE_FORMAT = '%Y-%m-%d'
+
+
+class ProfilingSettings:
+    HISTORY_SIZE = 20
+    DUMP_PATH = os.path.join('logs', 'profile.jsonl')
+    PROFILE_DIR = os.path.join('logs', 'profiles')
+    TOP_FUNCTIONS = 15
+
+
+class PromptSettings:
+    AMOUNT_DECIMALS = 0
+    ID_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+    FIELD_SEPARATOR = '|'
+
+
+class PipelineSettings:
+    QUEUE_SIZE = 4
+
+
+class ProfilerSettings:
+    SAMPLE_ROWS = 500
+    MIN_SCORE = 0.6
+    MIN_MARGIN = 0.2
+    TEXT_MIN_LENGTH = 8
+    CURRENCY_PATTERN = r'[\s€$£¥]|CHF|EUR|USD'
+
+
+class EditorSettings:
+    PAGE_SIZES = [50, 100, 500, 1000]
+    DEFAULT_PAGE_SIZE = 100
+
+
+class SearchSettings:
+    NGRAM_SIZE = 3
+    MAX_CHARS = 256
+    BATCH_SIZE = 20_000
+    MAX_DELTA_DOCS = 5_000
+
+
+class ClusterSettings:
+    NGRAM_SIZE = 3
+    NUM_HASHES = 32
+    MAX_CHARS = 40
+    BAND_SIZE = 4
+    MIN_SIMILARITY = 0.5
+    SEED = 0
@@ -1,22 +1,46 @@
 import streamlit as st
+import numpy as np
+import pandas as pd
 import utils
 import utils_io
 import utils_df
 import plots
-from constants import ColumnNames
+import figure_cache
+import merchant_index
+import recurring_payments
+import transaction_store
+import search_index
+import sidebar
+from constants import ColumnNames, Globals, PlotSettings, EditorSettings
+import profiling
 
 
+@st.experimental_fragment
+def display_dashboard():
+    df = st.session_state.current_df
+    filtered_df = sidebar.apply_filters(df)
+    if filtered_df.empty:
+        st.write("No valid data to display.")
+        return
+
+    st.write("You can edit your table here:")
+    display_data(filtered_df, df)
+
+
+@profiling.timed
 def display_data(filtered_df, df):
     # st.dataframe(df)
-    display_filtered_df(filtered_df, df)
+    cache = figure_cache.get_figure_cache()
+    view = cache.get_view(utils.get_data_version(), sidebar.get_filter_key())
+    display_filtered_df(filtered_df, cache, view)
 
-    utils_io.save_df_to_csv(filtered_df)
+    utils_io.save_df(filtered_df)
     filtered_df = utils.invert_amounts(filtered_df, ColumnNames.AMOUNT)
-    plots.display_summary_metrics(filtered_df)
+    plots.display_summary_metrics(cache.get(view, 'metrics', plots.get_summary_metrics, filtered_df))
 
-    category_color_map = plots.generate_color_map(filtered_df, ColumnNames.CATEGORY)
+    category_color_map = cache.get(view, 'color_map', plots.generate_color_map, filtered_df, ColumnNames.CATEGORY)
 
-    df_grouped = filtered_df.groupby(ColumnNames.CATEGORY)[ColumnNames.AMOUNT].sum().reset_index()
+    df_grouped = cache.get(view, 'category_totals', get_category_totals, filtered_df)
     # if df_grouped has negative values - st write warning and delete those from the df:
 
     if df_grouped[ColumnNames.AMOUNT].lt(0).any():
@@ -24,23 +48,139 @@ def display_data(filtered_df, df):
         df_grouped = df_grouped[df_grouped[ColumnNames.AMOUNT] >= 0]
 
     if not df_grouped.empty:
-        plots.plot_pie_chart(df_grouped, category_color_map)
+        st.markdown("<br>", unsafe_allow_html=True)
+        plots.plot_figure(cache.get(view, 'pie', plots.build_pie_chart, df_grouped, category_color_map),
+                          use_container_width=True)
+
+        granularity = select_granularity(filtered_df, cache, view)
+        plots.plot_figure(cache.get(view, f'bar_{granularity}', plots.build_bar_chart,
+                                    filtered_df, df_grouped, category_color_map, granularity))
 
-        monthly_expenses = utils_df.get_monthly_expense_df(filtered_df, df_grouped)
-        plots.plot_bar_chart(monthly_expenses, category_color_map)
+        sunburst_fig, other_categories = cache.get(view, 'sunburst', plots.build_sunburst_merchants_and_categories,
+                                                   filtered_df, category_color_map)
+        plots.plot_figure(sunburst_fig, use_container_width=True)
+        if other_categories:
+            plots.display_other_merchants(filtered_df, other_categories)
 
-        # if number of unique categories in df is less than 3:
-        if filtered_df[ColumnNames.CATEGORY].nunique() <= 3:
-            plots.plot_sunburst_merchants_and_categories(filtered_df, category_color_map)
-        else:
-            st.write("Further charts will be displayed after filtering to less than 3 categories.")
+        display_recurring_payments(cache.get(view, 'recurring_payments',
+                                             recurring_payments.detect_recurring_payments, filtered_df))
 
     else:
         st.write("No valid data to plot.")
 
 
-def display_filtered_df(filtered_df, df):
-    filtered_df = st.data_editor(filtered_df)
-    df.loc[filtered_df.index] = filtered_df
-    st.session_state['current_df'] = df
-    return df
+@profiling.timed
+def get_category_totals(filtered_df):
+    if transaction_store.is_active() and not sidebar.get_search_query():
+        df_grouped = transaction_store.query_category_totals(st.session_state.get('date_range', ()),
+                                                             sidebar.get_unselected_categories())
+        return utils.invert_amounts(df_grouped, ColumnNames.AMOUNT)
+    return filtered_df.groupby(ColumnNames.CATEGORY)[ColumnNames.AMOUNT].sum().reset_index()
+
+
+def display_recurring_payments(recurring_df):
+    if recurring_df.empty:
+        return
+
+    st.write("Recurring payments and subscriptions:")
+    col1, col2 = st.columns(2)
+    col1.metric(label="Recurring Payments", value=len(recurring_df))
+    col2.metric(label="Estimated Monthly Cost", value=f"${recurring_df['monthly_cost'].sum():,.2f}")
+    st.dataframe(recurring_df[['merchant', 'period', 'avg_amount', 'monthly_cost', 'occurrences',
+                               'last_charge', 'next_charge']],
+                 hide_index=True, use_container_width=True,
+                 column_config={'avg_amount': st.column_config.NumberColumn(format='%.2f'),
+                                'monthly_cost': st.column_config.NumberColumn(format='%.2f'),
+                                'last_charge': st.column_config.DateColumn(),
+                                'next_charge': st.column_config.DateColumn()})
+
+
+def select_granularity(df, cache, view):
+    granularity = st.radio("Time granularity:", PlotSettings.GRANULARITIES, horizontal=True, key='granularity')
+    if granularity == 'auto':
+        granularity = cache.get(view, 'auto_granularity', utils_df.get_auto_granularity, df)
+    return granularity
+
+
+def get_sort_order(df, column, descending):
+    if column is None:
+        return np.arange(len(df))
+    if column == ColumnNames.DATE:
+        values = utils.get_date_col_as_datetime(df)
+    elif pd.api.types.is_numeric_dtype(df[column]):
+        values = df[column]
+    else:
+        values = df[column].fillna('').astype(str)
+    return values.reset_index(drop=True).sort_values(ascending=not descending, kind='stable').index.to_numpy()
+
+
+def select_page(num_rows):
+    col1, col2, col3, col4 = st.columns(4)
+    page_size = col1.selectbox("Rows per page", EditorSettings.PAGE_SIZES, key='editor_page_size',
+                               index=EditorSettings.PAGE_SIZES.index(EditorSettings.DEFAULT_PAGE_SIZE))
+    num_pages = max((num_rows - 1) // page_size + 1, 1)
+    if st.session_state.get('editor_page', 1) > num_pages:
+        st.session_state.editor_page = num_pages
+    page = col2.number_input(f"Page (of {num_pages})", min_value=1, max_value=num_pages, key='editor_page')
+    return page_size, page, col3, col4
+
+
+@profiling.timed
+def display_filtered_df(filtered_df, cache, view):
+    columns = st.multiselect("Columns", list(filtered_df.columns), default=list(filtered_df.columns),
+                             key='editor_columns') or list(filtered_df.columns)
+    page_size, page, col3, col4 = select_page(len(filtered_df))
+    sort_column = col3.selectbox("Sort by", list(filtered_df.columns), index=None, key='editor_sort')
+    descending = col4.toggle("Descending", key='editor_descending')
+
+    order = cache.get(view, f'order_{sort_column}_{descending}', get_sort_order, filtered_df, sort_column, descending)
+    start = (page - 1) * page_size
+    page_df = filtered_df.iloc[order[start:start + page_size]][columns]
+    st.caption(f"Rows {min(start + 1, len(filtered_df))}–{start + len(page_df)} of {len(filtered_df)}")
+
+    editor_key = f'data_editor_{utils.get_data_version()}_{page}_{page_size}_{sort_column}_{descending}'
+    st.data_editor(page_df, key=editor_key, num_rows='dynamic',
+                   on_change=apply_editor_changes, args=(page_df.index, editor_key))
+
+
+def apply_editor_changes(row_labels, editor_key):
+    changes = st.session_state[editor_key]
+    df = st.session_state.current_df
+    was_stored = transaction_store.is_active()
+    was_indexed = search_index.is_current()
+    next_label = df.index.max() + 1 if not df.empty else 0
+    touched_labels = []
+
+    for position, edits in changes['edited_rows'].items():
+        label = row_labels[int(position)]
+        for col, value in edits.items():
+            df.at[label, col] = value
+        touched_labels.append(label)
+
+    deleted_labels = [row_labels[position] for position in changes['deleted_rows']]
+    if deleted_labels:
+        df.drop(index=deleted_labels, inplace=True)
+        touched_labels.extend(deleted_labels)
+
+    added_labels = []
+    for row in changes['added_rows']:
+        df.loc[next_label] = get_new_row(row)
+        added_labels.append(next_label)
+        next_label += 1
+    if added_labels:
+        sidebar.extend_date_range(df.loc[added_labels, ColumnNames.DATE])
+        touched_labels.extend(added_labels)
+
+    if touched_labels:
+        merchant_index.get_merchant_index().update_rows(df, touched_labels)
+        utils.bump_data_version()
+        transaction_store.sync_rows(df, touched_labels, was_stored)
+        search_index.sync_rows(df, touched_labels, was_indexed)
+
+
+def get_new_row(row):
+    new_row = {col: row.get(col) or '' for col in ColumnNames.as_list()}
+    new_row[ColumnNames.DATE] = new_row[ColumnNames.DATE] or pd.Timestamp.today().strftime(Globals.DATE_FORMAT)
+    amount = pd.to_numeric(row.get(ColumnNames.AMOUNT), errors='coerce')
+    new_row[ColumnNames.AMOUNT] = 0.0 if pd.isna(amount) else float(amount)
+    return new_row
@@ -0,0 +1,84 @@
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+from constants import PlotSettings
+
+
+class FigureCache:
+    """Bounded LRU of built figures and metrics, one entry per data version and filter view."""
+
+    def __init__(self, max_views=PlotSettings.FIGURE_CACHE_VIEWS):
+        self.max_views = max_views
+        self.views = OrderedDict()
+        self.sizes = {}
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_view(self, version, filter_key):
+        if version != self.version:
+            self.clear()
+            self.version = version
+        key = (version, filter_key)
+        if key in self.views:
+            self.views.move_to_end(key)
+        else:
+            self.views[key] = {}
+            self.sizes[key] = 0
+            if len(self.views) > self.max_views:
+                old_key, _ = self.views.popitem(last=False)
+                del self.sizes[old_key]
+        return key
+
+    def get(self, view_key, name, build, *args):
+        view = self.views[view_key]
+        if name in view:
+            self.hits += 1
+            return view[name]
+        self.misses += 1
+        view[name] = build(*args)
+        self.sizes[view_key] += get_value_size(view[name])
+        return view[name]
+
+    def clear(self):
+        self.views.clear()
+        self.sizes.clear()
+
+    def get_memory_usage(self):
+        return sum(self.sizes.values())
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {'views': len(self.views), 'mb': self.get_memory_usage() / 1e6, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+def get_value_size(value):
+    if isinstance(value, (tuple, list)):
+        return sum(get_value_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(get_value_size(item) for item in value.values())
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, 'data') and hasattr(value, 'layout'):
+        return sum(get_value_size(np.asarray(prop)) for trace in value.data
+                   for prop in trace.to_plotly_json().values() if isinstance(prop, (list, tuple, np.ndarray)))
+    return 0
+
+
+def get_figure_cache():
+    if 'figure_cache' not in st.session_state:
+        st.session_state.figure_cache = FigureCache()
+    return st.session_state.figure_cache
+
+
+def get_stats():
+    if 'figure_cache' not in st.session_state:
+        return None
+    stats = st.session_state.figure_cache.get_stats()
+    logging.debug(f"Figure cache: {stats}")
+    return stats
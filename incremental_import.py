@@ -0,0 +1,97 @@
+import logging
+from functools import partial
+import pandas as pd
+import streamlit as st
+from constants import ColumnNames, StoreSettings
+import ai_jobs
+import category_classifier
+import merchant_index
+import preprocess_df
+import preprocess_merchants_categories
+import profiling
+import transaction_store
+import utils
+import utils_io
+
+
+def get_known_fingerprints():
+    if 'row_fingerprints' not in st.session_state:
+        fingerprints = transaction_store.load_fingerprints() if StoreSettings.ENABLED else []
+        st.session_state.row_fingerprints = pd.Index(fingerprints, dtype='int64')
+    return st.session_state.row_fingerprints
+
+
+def record_fingerprints(fingerprints, replace=False):
+    fingerprints = pd.Index(pd.concat(fingerprints) if fingerprints else [], dtype='int64')
+    known = pd.Index([], dtype='int64') if replace else get_known_fingerprints()
+    st.session_state.row_fingerprints = known.append(fingerprints).unique()
+    if StoreSettings.ENABLED:
+        transaction_store.save_fingerprints(fingerprints, replace=replace)
+
+
+def get_known_categories():
+    index = merchant_index.get_merchant_index()
+    categories = index.get_category_names(index.get_resolved_codes())
+    return {merchant: category for merchant, category in zip(index.merchants, categories) if category}
+
+
+def get_history_docs(known_categories):
+    df = st.session_state.current_df
+    docs = category_classifier.get_merchant_docs(df[df[ColumnNames.MERCHANT].isin(list(known_categories))])
+    docs[ColumnNames.CATEGORY] = docs[ColumnNames.MERCHANT].map(known_categories)
+    return docs
+
+
+@profiling.timed
+def append_transactions(new_df):
+    df = st.session_state.current_df
+    index = merchant_index.get_merchant_index()
+    was_stored = transaction_store.is_active()
+
+    start = df.index.max() + 1 if not df.empty else 0
+    new_df.index = pd.RangeIndex(start, start + len(new_df))
+    df = pd.concat([df, new_df])
+    index.update_rows(df, new_df.index)
+
+    st.session_state.current_df = df
+    utils.bump_data_version()
+    transaction_store.sync_rows(df, new_df.index, was_stored)
+    return new_df
+
+
+def import_new_statements(ai_config):
+    display_import_message()
+    all_dfs = utils_io.upload_additional_csvs()
+    if not all_dfs:
+        return
+
+    uploads = st.session_state.get('append_uploads', 0)
+    valid_dfs, fingerprints = preprocess_df.format_columns_all_dfs(all_dfs, st.sidebar.container, ai_config,
+                                                                   get_known_fingerprints(),
+                                                                   key_prefix=f'append{uploads}_')
+    if len(valid_dfs) != len(all_dfs):
+        return
+
+    new_df, fingerprints = preprocess_df.drop_duplicate_rows(pd.concat(valid_dfs, ignore_index=True), fingerprints)
+    num_skipped = sum(len(df) for df in all_dfs) - len(new_df)
+
+    if not new_df.empty:
+        known_categories = get_known_categories()
+        history_docs = get_history_docs(known_categories)
+        new_df = append_transactions(new_df)
+        record_fingerprints([fingerprints])
+        pipeline = partial(preprocess_merchants_categories.run_ai_pipeline, known_categories=known_categories,
+                           history_docs=history_docs)
+        st.session_state.ai_job_id = ai_jobs.submit_ai_job(new_df, ai_config, list(st.session_state.categories),
+                                                           pipeline)
+        logging.info(f"Appended {len(new_df)} new transactions, skipped {num_skipped}.")
+
+    st.session_state.import_message = (f"Added {len(new_df)} new transactions, "
+                                       f"skipped {num_skipped} already imported or invalid rows.")
+    st.session_state.append_uploads = uploads + 1
+    st.rerun()
+
+
+def display_import_message():
+    if 'import_message' in st.session_state:
+        st.sidebar.success(st.session_state.pop('import_message'))
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+import threading
+
+_local = threading.local()
+
+
+class CheckpointStore:
+    """Append-only store of AI responses for one job, keyed by a hash of the query."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.responses = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.responses[entry['key']] = entry['response']
+
+    @staticmethod
+    def get_key(query, backend):
+        return hashlib.sha256(f'{backend}\n{query}'.encode()).hexdigest()
+
+    def get(self, query, backend):
+        with self.lock:
+            return self.responses.get(self.get_key(query, backend))
+
+    def put(self, query, backend, response):
+        key = self.get_key(query, backend)
+        with self.lock:
+            self.responses[key] = response
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'key': key, 'response': response}) + '\n')
+
+
+def activate(store):
+    _local.store = store
+
+
+def deactivate():
+    _local.store = None
+
+
+def get_active_store():
+    return getattr(_local, 'store', None)
@@ -0,0 +1,80 @@
+import logging
+import numpy as np
+import pandas as pd
+from constants import ClusterSettings
+import utils
+import profiling
+
+
+def get_leading_tokens(merchants):
+    return merchants.str.extract(r'([^\W_]+)', expand=False).fillna('')
+
+
+def get_minhash_signatures(merchants):
+    doc_ids, keys = utils.get_char_ngrams(' ' + merchants + ' ', ClusterSettings.NGRAM_SIZE,
+                                          ClusterSettings.MAX_CHARS + 2, distinct=True)
+    rng = np.random.default_rng(ClusterSettings.SEED)
+    multipliers = rng.integers(1, 2 ** 63, ClusterSettings.NUM_HASHES, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, ClusterSettings.NUM_HASHES, dtype=np.uint64)
+
+    hashes = pd.util.hash_array(keys)[:, None] * multipliers + offsets
+    starts = np.flatnonzero(np.r_[True, doc_ids[1:] != doc_ids[:-1]])
+    signatures = np.full((len(merchants), ClusterSettings.NUM_HASHES), np.iinfo(np.uint64).max, dtype=np.uint64)
+    signatures[doc_ids[starts]] = np.minimum.reduceat(hashes, starts, axis=0)
+    return signatures
+
+
+def get_similar_pairs(signatures, block_codes):
+    pairs = []
+    for band_start in range(0, ClusterSettings.NUM_HASHES, ClusterSettings.BAND_SIZE):
+        bucket_keys = block_codes.astype(np.uint64)
+        for column in range(band_start, band_start + ClusterSettings.BAND_SIZE):
+            bucket_keys = bucket_keys * np.uint64(1_000_003) ^ signatures[:, column]
+        bucket_codes, _ = pd.factorize(bucket_keys)
+        _, heads = np.unique(bucket_codes, return_index=True)
+        pairs.append(np.column_stack([np.arange(len(bucket_codes)), heads[bucket_codes]]))
+
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    agreement = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+    return pairs[agreement >= ClusterSettings.MIN_SIMILARITY]
+
+
+def get_components(num_nodes, pairs):
+    labels = np.arange(num_nodes)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, pairs[:, 0], labels[pairs[:, 1]])
+        np.minimum.at(labels, pairs[:, 1], labels[pairs[:, 0]])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+@profiling.timed
+def cluster_merchants(merchants):
+    counts = pd.Series(merchants, dtype=object).value_counts()
+    counts = counts[counts.index != '']
+    clusters = pd.DataFrame({'merchant': counts.index.astype(str), 'count': counts.to_numpy()})
+    if clusters.empty:
+        return {}, []
+    clusters['token'] = get_leading_tokens(clusters['merchant'])
+    block_codes, _ = pd.factorize(clusters['token'])
+
+    pairs = get_similar_pairs(get_minhash_signatures(clusters['merchant']), block_codes)
+    clusters['cluster'] = get_components(len(clusters), pairs)
+    clusters['length'] = clusters['merchant'].str.len()
+    ranked = clusters.sort_values(['cluster', 'count', 'length', 'merchant'], ascending=[True, False, True, True])
+    clusters['canonical'] = clusters['cluster'].map(ranked.groupby('cluster')['merchant'].first())
+
+    bare_tokens = clusters.loc[clusters['merchant'] == clusters['token'], 'token']
+    has_bare = clusters['token'].isin(bare_tokens)
+    clusters.loc[has_bare, 'canonical'] = clusters.loc[has_bare, 'token']
+
+    clusters_per_block = clusters[~has_bare].groupby('token')['cluster'].nunique()
+    ambiguous_blocks = clusters_per_block.index[clusters_per_block > 1]
+    ambiguous = pd.unique(clusters.loc[clusters['token'].isin(ambiguous_blocks), 'canonical']).tolist()
+
+    logging.info(f"Clustered {len(clusters)} merchants into {clusters['canonical'].nunique()} names, "
+                 f"{len(ambiguous)} in {len(ambiguous_blocks)} ambiguous blocks.")
+    return dict(zip(clusters['merchant'], clusters['canonical'])), ambiguous
@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import pandas as pd
+from collections import Counter
+from constants import ColumnNames, Globals, ExtractorSettings
+
+
+def tokenize(texts):
+    texts = pd.Series(texts, dtype=object).fillna('').astype(str)
+    return texts.str.lower().str.replace(r'[^\w\s&.\-]', ' ', regex=True).str.split()
+
+
+def find_merchant_span(tokens, merchant_tokens):
+    length = len(merchant_tokens)
+    if not length:
+        return None
+    for start in range(len(tokens) - length + 1):
+        if tokens[start:start + length] == merchant_tokens:
+            return start, length
+    return None
+
+
+def get_pair_templates(tokens, merchant_tokens):
+    span = find_merchant_span(tokens, merchant_tokens)
+    if span is None:
+        return []
+    start, length = span
+    num_tokens = len(tokens)
+    return [f'start|{start}|{length}',
+            f'end|{num_tokens - start}|{length}',
+            f'between|{start}|{num_tokens - start - length}']
+
+
+def load_template_counts(path=Globals.MERCHANT_TEMPLATES_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as json_file:
+        return json.load(json_file)
+
+
+def save_template_counts(template_counts, path=Globals.MERCHANT_TEMPLATES_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as json_file:
+        json.dump(template_counts, json_file)
+
+
+def learn_template_counts(texts, merchants, template_counts=None):
+    template_counts = template_counts or {}
+    pairs = pd.DataFrame({'tokens': tokenize(texts), 'merchant_tokens': tokenize(merchants)})
+    pairs = pairs[pairs['tokens'].str.len() > 0]
+
+    for tokens, merchant_tokens in zip(pairs['tokens'], pairs['merchant_tokens']):
+        anchor_counts = template_counts.setdefault(tokens[0], {'total': 0, 'templates': {}})
+        anchor_counts['total'] += 1
+        counts = Counter(anchor_counts['templates'])
+        counts.update(get_pair_templates(tokens, merchant_tokens))
+        anchor_counts['templates'] = dict(counts)
+
+    return template_counts
+
+
+def select_templates(template_counts):
+    templates = {}
+    for anchor, anchor_counts in template_counts.items():
+        if not anchor_counts['templates']:
+            continue
+        template, support = max(anchor_counts['templates'].items(), key=lambda item: item[1])
+        if (support >= ExtractorSettings.MIN_SUPPORT and
+                support / anchor_counts['total'] >= ExtractorSettings.MIN_PRECISION):
+            mode, first, second = template.split('|')
+            templates[anchor] = (mode, int(first), int(second))
+    return templates
+
+
+def slice_tokens(tokens, mode, first, second):
+    if mode == 'start':
+        return tokens.str[first:first + second]
+    if mode == 'end':
+        stop = -first + second
+        return tokens.str[-first:stop if stop < 0 else None]
+    return tokens.str[first:-second if second else None]
+
+
+def extract_merchants(texts, templates):
+    tokens = tokenize(texts)
+    merchants = pd.Series('', index=tokens.index, dtype=object)
+    anchors = tokens.str[0]
+
+    for anchor, (mode, first, second) in templates.items():
+        mask = anchors == anchor
+        if mask.any():
+            merchants[mask] = slice_tokens(tokens[mask], mode, first, second).str.join(' ')
+
+    too_long = merchants.str.split().str.len() >= Globals.MERCHANTS_MAX_WORDS
+    merchants[too_long | merchants.str.fullmatch(r'[\d\s.\-]*')] = ''
+    return merchants
+
+
+def get_known_templates(df):
+    template_counts = load_template_counts()
+    known = df[df[ColumnNames.MERCHANT].notna() & (df[ColumnNames.MERCHANT] != '')]
+    if not known.empty:
+        template_counts = learn_template_counts(known[ColumnNames.TEXT], known[ColumnNames.MERCHANT], template_counts)
+    return select_templates(template_counts)
+
+
+def extract_known_merchants(df, mask):
+    templates = get_known_templates(df)
+    merchants = extract_merchants(df.loc[mask, ColumnNames.TEXT], templates)
+    hits = int((merchants != '').sum())
+    logging.info(f"Merchant templates matched {hits} of {len(merchants)} rows.")
+    return merchants, hits
+
+
+def update_templates(texts, merchants):
+    template_counts = learn_template_counts(texts, merchants, load_template_counts())
+    save_template_counts(template_counts)
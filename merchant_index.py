@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from constants import ColumnNames
+
+
+def clean_merchants(merchants):
+    return merchants.fillna('').astype(str)
+
+
+def clean_categories(categories):
+    categories = categories.fillna('').astype(str)
+    return categories.where(categories != ',', '')
+
+
+class MerchantIndex:
+    """Per-merchant aggregates of the transaction table, kept in sync with row edits."""
+
+    def __init__(self, df):
+        merchant_codes, merchants = pd.factorize(clean_merchants(df[ColumnNames.MERCHANT]))
+        categories = clean_categories(df[ColumnNames.CATEGORY])
+        category_codes, category_names = pd.factorize(categories.where(categories != ''))
+
+        self.merchants = pd.Index(merchants)
+        self.categories = pd.Index(category_names)
+        self.row_codes = pd.Series(merchant_codes, index=df.index)
+        self.row_categories = pd.Series(category_codes, index=df.index)
+        self.row_amounts = df[ColumnNames.AMOUNT].astype(float).fillna(0.0)
+
+        num_merchants = len(self.merchants)
+        self.sums = np.bincount(merchant_codes, weights=self.row_amounts.to_numpy(), minlength=num_merchants)
+        self.counts = np.bincount(merchant_codes, minlength=num_merchants)
+        self.histogram = np.zeros((num_merchants, len(self.categories)), dtype=np.int64)
+        self._add_to_histogram(merchant_codes, category_codes, 1)
+
+    def _add_to_histogram(self, merchant_codes, category_codes, sign):
+        labelled = category_codes >= 0
+        np.add.at(self.histogram, (merchant_codes[labelled], category_codes[labelled]), sign)
+
+    def _extend(self, merchants, categories):
+        new_merchants = pd.Index(pd.unique(merchants[self.merchants.get_indexer(merchants) < 0]))
+        new_categories = pd.Index(pd.unique(categories[(categories != '') &
+                                                       (self.categories.get_indexer(categories) < 0)]))
+        num_merchants, num_categories = len(new_merchants), len(new_categories)
+
+        if num_merchants:
+            self.merchants = self.merchants.append(new_merchants)
+            self.sums = np.concatenate([self.sums, np.zeros(num_merchants)])
+            self.counts = np.concatenate([self.counts, np.zeros(num_merchants, dtype=self.counts.dtype)])
+            self.histogram = np.vstack([self.histogram,
+                                        np.zeros((num_merchants, self.histogram.shape[1]), dtype=np.int64)])
+        if num_categories:
+            self.categories = self.categories.append(new_categories)
+            self.histogram = np.hstack([self.histogram,
+                                        np.zeros((self.histogram.shape[0], num_categories), dtype=np.int64)])
+
+    def _remove_rows(self, labels):
+        merchant_codes = self.row_codes.loc[labels].to_numpy()
+        np.subtract.at(self.sums, merchant_codes, self.row_amounts.loc[labels].to_numpy())
+        np.subtract.at(self.counts, merchant_codes, 1)
+        self._add_to_histogram(merchant_codes, self.row_categories.loc[labels].to_numpy(), -1)
+
+    def _add_rows(self, rows):
+        merchants = clean_merchants(rows[ColumnNames.MERCHANT]).to_numpy()
+        categories = clean_categories(rows[ColumnNames.CATEGORY]).to_numpy()
+        amounts = rows[ColumnNames.AMOUNT].astype(float).fillna(0.0)
+        self._extend(merchants, categories)
+
+        merchant_codes = self.merchants.get_indexer(merchants)
+        category_codes = np.where(categories != '', self.categories.get_indexer(categories), -1)
+        np.add.at(self.sums, merchant_codes, amounts.to_numpy())
+        np.add.at(self.counts, merchant_codes, 1)
+        self._add_to_histogram(merchant_codes, category_codes, 1)
+        return merchant_codes, category_codes, amounts
+
+    def update_rows(self, df, labels):
+        labels = pd.Index(labels).unique()
+        known = labels.intersection(self.row_codes.index)
+        present = labels.intersection(df.index)
+        self._remove_rows(known)
+
+        merchant_codes, category_codes, amounts = self._add_rows(df.loc[present])
+        existing = present.isin(known)
+        self.row_codes.loc[present[existing]] = merchant_codes[existing]
+        self.row_categories.loc[present[existing]] = category_codes[existing]
+        self.row_amounts.loc[present[existing]] = amounts.to_numpy()[existing]
+
+        deleted = known.difference(present)
+        added = present[~existing]
+        if len(deleted) or len(added):
+            self.row_codes = pd.concat([self.row_codes.drop(deleted),
+                                        pd.Series(merchant_codes[~existing], index=added)])
+            self.row_categories = pd.concat([self.row_categories.drop(deleted),
+                                             pd.Series(category_codes[~existing], index=added)])
+            self.row_amounts = pd.concat([self.row_amounts.drop(deleted), amounts[~existing]])
+
+    def get_memory_usage(self):
+        arrays = [self.sums, self.counts, self.histogram]
+        series = [self.row_codes, self.row_categories, self.row_amounts]
+        return (sum(array.nbytes for array in arrays) + sum(int(s.memory_usage()) for s in series) +
+                int(self.merchants.memory_usage(deep=True)))
+
+    def get_resolved_codes(self):
+        if not self.histogram.shape[1]:
+            return np.full(len(self.merchants), -1)
+        return np.where(self.histogram.sum(axis=1) > 0, self.histogram.argmax(axis=1), -1)
+
+    def get_category_names(self, codes):
+        names = np.asarray(self.categories.append(pd.Index([''])), dtype=object)
+        return names[codes]
+
+    def get_summary_df(self):
+        active = self.counts > 0
+        counts = np.where(active, self.counts, 1)
+        summary_df = pd.DataFrame({'merchant': self.merchants,
+                                   'avg_amount': self.sums / counts,
+                                   'num_transactions': self.counts,
+                                   'category': self.get_category_names(self.get_resolved_codes())})
+        return summary_df[active].sort_values('merchant').reset_index(drop=True)
+
+    def get_merchant_category_codes(self, merchant_categories):
+        merchant_categories = {merchant: category for merchant, category in merchant_categories.items()
+                               if isinstance(category, str) and category not in ('', ',')}
+        merchants = np.array(list(merchant_categories.keys()), dtype=object)
+        categories = np.array(list(merchant_categories.values()), dtype=object)
+        self._extend(merchants, categories)
+
+        category_codes = self.get_resolved_codes()
+        category_codes[self.merchants.get_indexer(merchants)] = self.categories.get_indexer(categories)
+        return category_codes
+
+    def write_categories(self, df, mask, category_codes):
+        changed = mask & (category_codes >= 0)
+        if changed.any():
+            labels = df.index[changed]
+            df.loc[labels, ColumnNames.CATEGORY] = self.get_category_names(category_codes[changed])
+            self.update_rows(df, labels)
+        return df
+
+    def propagate_categories(self, df):
+        single_category = (self.histogram > 0).sum(axis=1) == 1
+        row_codes = self.row_codes.loc[df.index].to_numpy()
+        category_codes = np.where(single_category[row_codes], self.histogram.argmax(axis=1)[row_codes], -1) \
+            if self.histogram.shape[1] else np.full(len(df), -1)
+        current_codes = self.row_categories.loc[df.index].to_numpy()
+        return self.write_categories(df, category_codes != current_codes, category_codes)
+
+    def populate_categories(self, df, merchant_categories):
+        row_codes = self.row_codes.loc[df.index].to_numpy()
+        empty = self.row_categories.loc[df.index].to_numpy() < 0
+        return self.write_categories(df, empty, self.get_merchant_category_codes(merchant_categories)[row_codes])
+
+
+def build_merchant_index(df):
+    st.session_state.merchant_index = MerchantIndex(df)
+    return st.session_state.merchant_index
+
+
+def get_merchant_index():
+    if 'merchant_index' not in st.session_state:
+        return build_merchant_index(st.session_state.current_df)
+    return st.session_state.merchant_index
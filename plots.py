@@ -1,9 +1,11 @@
-import plotly.express as px
-import plotly.graph_objects as go
+import logging
 import streamlit as st
-from constants import ColumnNames
+from constants import ColumnNames, Globals
 import sidebar
+import utils_df
 from constants import PlotSettings
+from settings import lazy_import
+import profiling
 
 
 def generate_color_map(df, column):
@@ -11,7 +13,8 @@ def generate_color_map(df, column):
     return {category: color for category, color in zip(unique_categories, PlotSettings.DEFAULT_COLORS)}
 
 
-def display_summary_metrics(df):
+@profiling.timed
+def get_summary_metrics(df):
     # Calculate the total expenses
     total_expenses = df[ColumnNames.AMOUNT].sum()
 
@@ -22,6 +25,11 @@ def display_summary_metrics(df):
 
     avg_expenses_per_month = total_expenses / num_months
     avg_expenses_per_day = total_expenses / num_days
+    return total_expenses, avg_expenses_per_month, avg_expenses_per_day
+
+
+def display_summary_metrics(metrics):
+    total_expenses, avg_expenses_per_month, avg_expenses_per_day = metrics
 
     st.markdown("<br>", unsafe_allow_html=True)
 
@@ -32,14 +40,19 @@ def display_summary_metrics(df):
     col3.metric(label="Average Expenses per Day", value=f"${avg_expenses_per_day:,.2f}")
 
 
-def plot_pie_chart(df_grouped, category_color_map):
-    st.markdown("<br>", unsafe_allow_html=True)
+@profiling.timed
+def plot_figure(fig, use_container_width=False):
+    st.plotly_chart(fig, use_container_width=use_container_width)
+
+
+@profiling.timed
+def build_pie_chart(df_grouped, category_color_map):
+    px = lazy_import('plotly.express')
     fig = px.pie(
         df_grouped,
         values=ColumnNames.AMOUNT,
         names=ColumnNames.CATEGORY,
-        width=1000,
-        height=1000,
+        height=PlotSettings.PIE_HEIGHT,
         hole=0.4,
         color=ColumnNames.CATEGORY,
         color_discrete_map=category_color_map
@@ -68,36 +81,56 @@ def plot_pie_chart(df_grouped, category_color_map):
         font=dict(size=PlotSettings.LABEL_SIZE)
     )
 
-    st.plotly_chart(fig)
+    track_figure_size(fig, 'pie')
+    return fig
 
 
-def plot_bar_chart(monthly_expenses, category_color_map):
+@profiling.timed
+def build_bar_chart(df, df_grouped, category_color_map, granularity):
+    px = lazy_import('plotly.express')
+    go = lazy_import('plotly.graph_objects')
 
-    monthly_expenses.rename(columns={'category': 'cate'}, inplace=True)
+    period_expenses = utils_df.get_period_expense_df(df, df_grouped, granularity)
+    period_expenses.rename(columns={'category': 'cate'}, inplace=True)
+    label = granularity.capitalize()
+    show_text = len(period_expenses) <= PlotSettings.MAX_BAR_TEXT_LABELS
 
     fig = px.bar(
-        monthly_expenses,
-        x='month',
+        period_expenses,
+        x='period',
         y=ColumnNames.AMOUNT,
         color='cate',
-        title='Monthly Expenses by Category',
-        labels={'month': 'Month', ColumnNames.AMOUNT: 'Expenses (€)'},
-        height=600,
-        text=ColumnNames.AMOUNT,
-        category_orders={'cate': list(monthly_expenses['cate'].cat.categories)},
+        title=f'{label}ly Expenses by Category',
+        labels={'period': label, ColumnNames.AMOUNT: 'Expenses (€)'},
+        height=PlotSettings.BAR_HEIGHT,
+        text=ColumnNames.AMOUNT if show_text else None,
+        category_orders={'cate': list(period_expenses['cate'].cat.categories)},
         color_discrete_map=category_color_map
     )
 
     fig.update_traces(
-        texttemplate='%{y:.2f}€',
-        hovertemplate='<b>Month: %{x}</b><br>Expense: %{y:.2f}€'
+        texttemplate='%{y:.2f}€' if show_text else None,
+        hovertemplate=f'<b>{label}: %{{x}}</b><br>Expense: %{{y:.2f}}€'
     )
 
+    totals = period_expenses.groupby('period', sort=False)[ColumnNames.AMOUNT].sum()
+    fig.add_trace(go.Scatter(
+        x=totals.index,
+        y=totals.values,
+        mode='text' if len(totals) <= PlotSettings.MAX_TOTAL_LABELS else 'markers',
+        text=[f'<b>{total:.2f}€</b>' for total in totals.values],
+        textposition='top center',
+        textfont=dict(size=14, color='green'),
+        marker=dict(color='green', size=4),
+        hovertemplate=f'<b>{label}: %{{x}}</b><br>Total: %{{y:.2f}}€<extra></extra>',
+        showlegend=False
+    ))
+
     fig.update_layout(
-        xaxis_title='Month',
+        xaxis_title=label,
         yaxis_title='Total Expenses',
         barmode='stack',
-        xaxis={'type': 'category'},
+        xaxis={'type': 'category', 'categoryorder': 'array', 'categoryarray': list(totals.index)},
         legend_title='Categories',
         title=dict(
             text='Expenses by Category',
@@ -106,26 +139,24 @@ def plot_bar_chart(monthly_expenses, category_color_map):
         font=dict(size=PlotSettings.LABEL_SIZE)
     )
 
-    for month, group in monthly_expenses.groupby('month'):
-        total_expenses = group[ColumnNames.AMOUNT].sum()
-        fig.add_annotation(
-            x=month,
-            y=total_expenses,
-            text=f'<b>{total_expenses:.2f}€</b>',
-            showarrow=False,
-            yshift=30,
-            font=dict(
-                size=14,
-                color='green',
-            )
+    track_figure_size(fig, 'bar')
+    return fig
 
-        )
 
-    st.plotly_chart(fig)
+def track_figure_size(fig, name):
+    if Globals.DEBUG:
+        size = len(fig.to_json())
+        st.session_state.setdefault('figure_sizes', {})[name] = size
+        logging.debug(f"Figure '{name}' payload: {size / 1024:.1f} KB")
+        if size > PlotSettings.MAX_FIGURE_BYTES:
+            logging.warning(f"Figure '{name}' exceeds the payload budget ({size} bytes).")
 
 
-def plot_sunburst_merchants_and_categories(df, category_color_map):
-    grouped_df = df.groupby(['category', 'merchant'], as_index=False).sum()
+@profiling.timed
+def build_sunburst_merchants_and_categories(df, category_color_map):
+    px = lazy_import('plotly.express')
+    totals_df = utils_df.get_category_merchant_totals(df)
+    grouped_df, other_categories = utils_df.get_top_merchants_df(totals_df)
 
     # Creating the sunburst chart
     fig = px.sunburst(
@@ -134,10 +165,20 @@ def plot_sunburst_merchants_and_categories(df, category_color_map):
         values='amount',
         color='category',
         color_discrete_map=category_color_map,
-        width=1000,
-        height=1000,
+        height=PlotSettings.SUNBURST_HEIGHT,
         branchvalues='total'
     )
 
     fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
-    st.plotly_chart(fig)
+    track_figure_size(fig, 'sunburst')
+    return fig, other_categories
+
+
+@profiling.timed
+def display_other_merchants(df, other_categories):
+    category = st.selectbox(f"Show merchants in the '{PlotSettings.OTHER_LABEL}' bucket of:", other_categories,
+                            index=None, key='other_merchants_category')
+    if category is not None:
+        category_df = df[df[ColumnNames.CATEGORY] == category]
+        totals_df = utils_df.get_category_merchant_totals(category_df)
+        st.dataframe(utils_df.get_other_merchants_df(totals_df), hide_index=True, use_container_width=True)
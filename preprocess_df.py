@@ -1,31 +1,61 @@
+import logging
 import streamlit as st
 import pandas as pd
 from constants import ColumnNames, Globals, Colors
 import ai_queries
+import column_profiler
 import utils_ai
 import utils
+import profiling
 
 
-def format_columns_all_dfs(dfs, container, ai_config, client):
+@profiling.timed
+def format_columns_all_dfs(dfs, container, ai_config, known_fingerprints=None, key_prefix=''):
     clean_dfs = []
+    fingerprints = []
     with container():
         for i, df in enumerate(dfs):
-            df = rename_columns(df, ai_config, client, i)
+            df = rename_columns(df, ai_config, f'{key_prefix}{i}')
             if all(col in df.columns for col in ColumnNames.initial_columns_as_list()
                    ) and len(df.columns) == len(set(df.columns)):
+                df = drop_known_rows(df, known_fingerprints)
                 df = format_df(df)
                 clean_df = df[ColumnNames.as_list()]
                 clean_dfs.append(clean_df)
-        return clean_dfs
+                fingerprints.append(df[Globals.FINGERPRINT_COLUMN])
+        return clean_dfs, fingerprints
 
 
-def rename_columns(df, ai_config, client, i):
+def get_row_fingerprints(df):
+    keys = df[ColumnNames.initial_columns_as_list()].astype(str).apply(lambda column: column.str.strip())
+    hashes = pd.util.hash_pandas_object(keys, index=False)
+    occurrences = hashes.groupby(hashes).cumcount()
+    fingerprints = pd.util.hash_pandas_object(pd.DataFrame({'hash': hashes, 'occurrence': occurrences}), index=False)
+    return fingerprints.astype('int64')
+
+
+def drop_known_rows(df, known_fingerprints=None):
+    df = df.assign(**{Globals.FINGERPRINT_COLUMN: get_row_fingerprints(df)})
+    if known_fingerprints is not None:
+        df = df[~df[Globals.FINGERPRINT_COLUMN].isin(known_fingerprints)]
+    return df
+
+
+def drop_duplicate_rows(df, fingerprints):
+    fingerprints = pd.concat(fingerprints, ignore_index=True)
+    is_new = ~fingerprints.duplicated().to_numpy()
+    if not is_new.all():
+        logging.info(f"Dropped {len(df) - is_new.sum()} rows repeated across the uploaded files.")
+    return df[is_new].reset_index(drop=True), fingerprints[is_new].reset_index(drop=True)
+
+
+def rename_columns(df, ai_config, i):
     state_str = f'df{i}_columns'
     is_ran_ai_str = f'is_ran_ai_df{i}_column_names'
     if state_str not in st.session_state and is_ran_ai_str not in st.session_state:
         st.session_state[is_ran_ai_str] = True
         if not all(col in df.columns for col in ColumnNames.initial_columns_as_list()):
-            df = ai_rename_columns(df, ai_config, client)
+            df = profile_rename_columns(df, ai_config)
     df = add_missing_columns(df, ColumnNames.additional_columns_as_list())
 
     if all(c in df.columns for c in ColumnNames.initial_columns_as_list()):
@@ -35,12 +65,19 @@ def rename_columns(df, ai_config, client, i):
     return df
 
 
-def ai_rename_columns(df, ai_config, client):
+def profile_rename_columns(df, ai_config):
+    mapping, _, is_confident = column_profiler.detect_columns(df)
+    if is_confident:
+        return column_profiler.rename_detected_columns(df, mapping)
+    return ai_rename_columns(df, ai_config)
+
+
+def ai_rename_columns(df, ai_config):
 
     max_tokens = 40
     column_names = df.columns
     query = ai_queries.get_column_names_query(column_names)
-    column_name_dict_as_str = utils_ai.query_ai(query, ai_config, client, max_tokens)
+    column_name_dict_as_str = utils_ai.query_ai(query, ai_config, max_tokens)
     column_names_dict = utils.get_dict_from_string(column_name_dict_as_str, flip=True)
     df = df.rename(columns=column_names_dict)
 
@@ -90,6 +127,7 @@ def manual_rename_columns(df, idx):
     st.dataframe(df.head())
 
 
+@profiling.timed
 def format_df(df):
     df.reset_index(drop=True, inplace=True)
     df = df[df[ColumnNames.AMOUNT].notna()]
@@ -1,215 +1,407 @@
 import streamlit as st
+import pandas as pd
 import logging
-import numpy as np
+import queue
 import re
-from constants import ColumnNames, Globals
+import threading
+from constants import ColumnNames, Globals, JobSettings, PipelineSettings
+import ai_jobs
 import ai_queries
 import utils_ai
 import utils
-
-
-def add_merchants_and_categories(df, ai_config, client):
-    message_placeholder = st.empty()
-    message_placeholder.info((f"Processing merchant names from transaction texts and sorting to categories. " 
-                              f"This may take a couple of minutes.. "
-                              f"It's good time to make a coffee or go to the pull-up bar."))
-    logging.info("Starting ai merchant extraction process.")
-
-    if 'is_ran_ai' not in st.session_state:
-        df[ColumnNames.MERCHANT] = ai_add_and_standardize_merchants(df, ai_config, client)
-        df = propagate_df_merchant_categories(df)
-        df.to_csv('temp_df_with_categories_prop.csv', index=False)
-        merchants_summary_df = get_merchants_summary_df(df)
-        merchants_summary_df.to_csv('temp_merchant_summary.csv', index=False)
-
-        merchants_summary_df = get_merchants_categories(merchants_summary_df, ai_config, client)
-        df = populate_categories(df, merchants_summary_df)
-
-        st.session_state.is_ran_ai = True
-        st.session_state.current_df = df
-
+import category_classifier
+import job_checkpoints
+import merchant_clusters
+import merchant_extractor
+import merchant_index
+import transaction_store
+import profiling
+import prompt_encoder
+
+
+def add_merchants_and_categories(df, ai_config):
+    if 'is_ran_ai' not in st.session_state and 'ai_job_id' not in st.session_state:
+        logging.info("Starting ai merchant extraction process.")
+        st.session_state.ai_job_id = ai_jobs.submit_ai_job(df, ai_config, list(st.session_state.categories),
+                                                             run_ai_pipeline)
+    if 'ai_job_id' in st.session_state:
+        display_ai_job_progress()
+
+    display_template_hit_rate()
+
+    return st.session_state.current_df
+
+
+@st.experimental_fragment(run_every=JobSettings.POLL_SECONDS)
+def display_ai_job_progress():
+    job = ai_jobs.get_job(st.session_state.ai_job_id)
+    if job is None:
+        del st.session_state.ai_job_id
+        st.rerun()
+
+    if job.status == 'failed':
+        st.error(f"Processing merchants and categories failed: {job.error}")
+        if st.button("Retry"):
+            ai_jobs.retry_ai_job(job.job_id)
+            st.rerun()
+        return
+
+    if job.status == 'done':
+        result_df, _, template_hits = job.result
+        apply_ai_job_result(result_df, template_hits)
+        ai_jobs.release_job(job.job_id)
+        st.rerun()
+
+    st.info((f"Processing merchant names from transaction texts and sorting to categories ({job.stage}). "
+             f"This may take a couple of minutes.. "
+             f"It's good time to make a coffee or go to the pull-up bar. "
+             f"The table below fills in as results arrive."))
+
+    version, merchants, categories = job.get_partial_results()
+    if version != st.session_state.get('ai_job_applied_version'):
+        apply_partial_results(st.session_state.current_df, merchants, categories)
+        st.session_state.ai_job_applied_version = version
+        st.rerun()
+
+
+@profiling.timed
+def apply_partial_results(df, merchants, categories):
+    labels = df.index.intersection(list(merchants))
+    if not len(labels):
+        return
+    df.loc[labels, ColumnNames.MERCHANT] = [merchants[label] for label in labels]
+    uncategorized = labels[utils.get_df_mask(df.loc[labels], ColumnNames.CATEGORY).to_numpy()]
+    if categories and len(uncategorized):
+        df.loc[uncategorized, ColumnNames.CATEGORY] = df.loc[uncategorized, ColumnNames.MERCHANT].map(
+            categories).fillna(df.loc[uncategorized, ColumnNames.CATEGORY])
+    merchant_index.get_merchant_index().update_rows(df, labels)
+    utils.bump_data_version()
+
+
+@profiling.timed
+def apply_ai_job_result(result_df, template_hits):
+    df = st.session_state.current_df
+    is_append = 'is_ran_ai' in st.session_state
+    labels = df.index.intersection(result_df.index)
+    df.loc[labels, [ColumnNames.MERCHANT, ColumnNames.CATEGORY]] = \
+        result_df.loc[labels, [ColumnNames.MERCHANT, ColumnNames.CATEGORY]]
+    merchant_index.get_merchant_index().update_rows(df, labels)
+
+    st.session_state.merchant_template_hits = template_hits
+    st.session_state.is_ran_ai = True
+    st.session_state.current_df = df
+    st.session_state.pop('ai_job_id', None)
+    st.session_state.pop('ai_job_applied_version', None)
+    utils.bump_data_version()
+    if is_append:
+        transaction_store.sync_rows(df, labels, True)
     else:
-        merchants_summary_df = get_merchants_summary_df(df)
-
-    message_placeholder.empty()
-
-    return df, merchants_summary_df
-
-
-def ai_add_and_standardize_merchants(df, ai_config, client):
-    first_mask = None
-    for i in range(4):
-        mask = utils.get_df_mask(df, ColumnNames.MERCHANT)
-        if i == 0:
-            first_mask = mask
-        texts_list = df.loc[mask, ColumnNames.TEXT].tolist()
-        if texts_list:
-            df.loc[mask, ColumnNames.MERCHANT] = ai_get_merchants_from_text(texts_list, ai_config, client)
-
-    if first_mask is not None:
-        masked_merchants = df.loc[first_mask, ColumnNames.MERCHANT].tolist()
-        standardized_merchants = standardize_merchant_names(masked_merchants)
-        df.loc[first_mask, ColumnNames.MERCHANT] = standardized_merchants
-
-    merchants = df[ColumnNames.MERCHANT].tolist()
-    merchants = ai_standardize_merchant_names(merchants, ai_config, client)
-
-    return merchants
-
-
-def propagate_df_merchant_categories(df):
-    valid_categories = df[~df[ColumnNames.CATEGORY].isin([np.nan, None, ''])]
-    unique_categories = valid_categories.groupby(ColumnNames.MERCHANT)[ColumnNames.CATEGORY].nunique()
-    single_category_merchants = unique_categories[unique_categories == 1].index
-    valid_single_categories = valid_categories[valid_categories[ColumnNames.MERCHANT].isin(single_category_merchants)]
-    merchant_to_category = valid_single_categories.groupby(ColumnNames.MERCHANT)[ColumnNames.CATEGORY].first().to_dict()
-    df[ColumnNames.CATEGORY] = df.apply(lambda row: merchant_to_category.get(row[ColumnNames.MERCHANT],
-                                                                             row[ColumnNames.CATEGORY]), axis=1)
-
-    return df
-
-
-def get_merchants_summary_df(df):
-    merchants_summary_df = df.groupby(ColumnNames.MERCHANT).agg({
-        ColumnNames.AMOUNT: ['mean', 'count'],
-        ColumnNames.CATEGORY: lambda x: x.mode()[0] if not x.mode().empty else np.nan
-    }).reset_index()
-    merchants_summary_df.columns = ['merchant', 'avg_amount', 'num_transactions', 'category']
+        transaction_store.sync_all(df)
+
+
+def display_template_hit_rate():
+    if 'merchant_template_hits' in st.session_state:
+        hits, total = st.session_state.merchant_template_hits
+        if total:
+            st.caption(f"Merchant templates resolved {hits} of {total} transactions ({hits / total:.0%}) "
+                       f"without an AI call.")
+
+
+@profiling.timed
+def run_ai_pipeline(df, ai_config, categories, on_stage=None, on_merchants=None, on_categories=None,
+                    known_categories=None, history_docs=None):
+    on_stage = on_stage or (lambda stage: None)
+    on_merchants = on_merchants or (lambda merchants: None)
+    on_categories = on_categories or (lambda merchant_categories: None)
+    known_categories = known_categories or {}
+
+    on_stage('extracting merchants and categories')
+    template_hits, category_stage = stream_merchants_and_categories(df, ai_config, categories, known_categories,
+                                                                    history_docs, on_merchants, on_categories)
+    on_merchants(dict(zip(df.index, df[ColumnNames.MERCHANT])))
+
+    on_stage('reconciling categories')
+    index = merchant_index.MerchantIndex(df)
+    df = propagate_df_merchant_categories(df, index)
+    merchants_summary_df = get_merchants_summary_df(index)
+    merchants_summary_df = fill_known_categories(merchants_summary_df,
+                                                 {**known_categories, **category_stage.merchant_categories})
+
+    merchants_summary_df = category_classifier.fill_confident_categories(df, merchants_summary_df, history_docs)
+    merchants_summary_df = get_merchants_categories(merchants_summary_df, ai_config, categories, on_categories,
+                                                    skip_merchants=category_stage.attempted)
+    df = populate_categories(df, merchants_summary_df, index)
+    return df, merchants_summary_df, index, template_hits
+
+
+def fill_known_categories(merchants_summary_df, known_categories):
+    mask = utils.get_df_mask(merchants_summary_df, 'category')
+    merchants_summary_df.loc[mask, 'category'] = merchants_summary_df.loc[mask, 'merchant'].map(
+        known_categories).fillna(merchants_summary_df.loc[mask, 'category'])
     return merchants_summary_df
 
 
-def get_merchants_categories(merchant_summary_df, ai_config, client):
-    mask = utils.get_df_mask(merchant_summary_df, 'category')
+def stream_merchants_and_categories(df, ai_config, categories, known_categories, history_docs, on_merchants,
+                                    on_categories):
+    merchant_queue = queue.Queue(maxsize=PipelineSettings.QUEUE_SIZE)
+    category_stage = CategoryStage(ai_config, categories, known_categories, history_docs, on_categories)
+    worker = threading.Thread(target=category_stage.run, args=(merchant_queue, job_checkpoints.get_active_store()),
+                              name='category-stage', daemon=True)
+    worker.start()
+
+    def emit(labels):
+        if category_stage.error is not None:
+            raise category_stage.error
+        on_merchants(dict(zip(labels, df.loc[labels, ColumnNames.MERCHANT])))
+        merchant_queue.put(df.loc[labels, ColumnNames.as_list()].copy())
+
+    try:
+        template_hits, merchant_names = stream_merchants(df, ai_config, emit)
+    finally:
+        merchant_queue.put(None)
+        worker.join()
+    if category_stage.error is not None:
+        raise category_stage.error
+    category_stage.rename_merchants(merchant_names)
+    return template_hits, category_stage
+
+
+@profiling.timed
+def stream_merchants(df, ai_config, emit):
+    first_mask = utils.get_df_mask(df, ColumnNames.MERCHANT)
+    template_merchants, hits = merchant_extractor.extract_known_merchants(df, first_mask)
+    df.loc[first_mask, ColumnNames.MERCHANT] = template_merchants
+    ai_mask = utils.get_df_mask(df, ColumnNames.MERCHANT)
+    ai_merchants = df.loc[ai_mask, ColumnNames.MERCHANT].copy()
+
+    def clean_and_emit(labels, clean):
+        if clean and len(labels):
+            df.loc[labels, ColumnNames.MERCHANT] = clean_merchant_names(df.loc[labels, ColumnNames.MERCHANT].tolist())
+        for chunk_labels in utils.get_list_chunks(labels, ai_config.CHUNK_SIZE):
+            emit(chunk_labels)
+
+    clean_and_emit(df.index[~first_mask], clean=False)
+    clean_and_emit(df.index[first_mask & ~ai_mask], clean=True)
+
+    for _ in range(4):
+        labels = df.index[utils.get_df_mask(df, ColumnNames.MERCHANT)]
+        for chunk_labels in utils.get_list_chunks(labels, ai_config.CHUNK_SIZE):
+            merchants = get_merchant_chunk(df.loc[chunk_labels, ColumnNames.TEXT].tolist(), ai_config)
+            df.loc[chunk_labels, ColumnNames.MERCHANT] = merchants
+            ai_merchants.loc[chunk_labels] = merchants
+            clean_and_emit(chunk_labels[[merchant != '' for merchant in merchants]], clean=True)
+    logging.info("ai merchant extraction completed.")
+
+    if ai_mask.any():
+        merchant_extractor.update_templates(df.loc[ai_mask, ColumnNames.TEXT], ai_merchants)
+
+    merchant_names = standardize_merchants(df, ai_config)
+    return (hits, int(first_mask.sum())), merchant_names
+
+
+class CategoryStage:
+    """Categorizes merchants as the merchant stage streams them in, batching the ones that need the AI."""
+
+    def __init__(self, ai_config, categories, known_categories, history_docs, on_categories):
+        self.ai_config = ai_config
+        self.categories = categories
+        self.known_categories = known_categories
+        self.history_docs = history_docs
+        self.on_categories = on_categories
+        self.merchant_categories = {}
+        self.docs = {}
+        self.pending = []
+        self.attempted = set()
+        self.error = None
+
+    def run(self, merchant_queue, checkpoint_store):
+        job_checkpoints.activate(checkpoint_store)
+        try:
+            while (rows := merchant_queue.get()) is not None:
+                if self.error is None:
+                    self.guard(self.add_rows, rows)
+            if self.error is None:
+                self.guard(self.flush)
+        finally:
+            job_checkpoints.deactivate()
+
+    def guard(self, step, *args):
+        try:
+            step(*args)
+        except Exception as e:
+            logging.exception("Category stage failed.")
+            self.error = e
+
+    def add_rows(self, rows):
+        rows = rows[rows[ColumnNames.MERCHANT] != '']
+        for merchant, text, amount in zip(rows[ColumnNames.MERCHANT], rows[ColumnNames.TEXT],
+                                          rows[ColumnNames.AMOUNT]):
+            doc = self.docs.setdefault(merchant, [text, 0.0, 0])
+            doc[1] += amount
+            doc[2] += 1
+
+        labelled = rows[~utils.get_df_mask(rows, ColumnNames.CATEGORY)]
+        new_categories = {merchant: category for merchant, category in
+                          zip(labelled[ColumnNames.MERCHANT], labelled[ColumnNames.CATEGORY])
+                          if merchant not in self.merchant_categories}
+        for merchant in pd.unique(rows[ColumnNames.MERCHANT]):
+            if merchant in self.merchant_categories or merchant in new_categories or merchant in self.attempted:
+                continue
+            if merchant in self.known_categories:
+                new_categories[merchant] = self.known_categories[merchant]
+            elif merchant not in self.pending:
+                self.pending.append(merchant)
+        self.add_categories(new_categories)
+
+        if len(self.pending) >= self.ai_config.CHUNK_SIZE:
+            self.flush()
+
+    def add_categories(self, new_categories):
+        if new_categories:
+            self.merchant_categories.update(new_categories)
+            self.on_categories(new_categories)
+
+    def rename_merchants(self, merchant_names):
+        for merchant, category in list(self.merchant_categories.items()):
+            self.merchant_categories.setdefault(merchant_names.get(merchant, merchant), category)
+        self.attempted.update([merchant_names.get(merchant, merchant) for merchant in self.attempted])
+
+    def get_docs(self, merchants):
+        return pd.DataFrame([(merchant, self.docs[merchant][0], self.docs[merchant][1] / self.docs[merchant][2])
+                             for merchant in merchants],
+                            columns=[ColumnNames.MERCHANT, 'text', 'avg_amount'])
+
+    def flush(self):
+        pending = [merchant for merchant in self.pending if merchant not in self.merchant_categories]
+        self.pending = []
+        if not pending:
+            return
+
+        test_docs = self.get_docs(pending)
+        train_docs = self.get_docs(self.merchant_categories)
+        train_docs[ColumnNames.CATEGORY] = list(self.merchant_categories.values())
+        train_docs = category_classifier.add_history_docs(train_docs, self.history_docs)
+        confident = category_classifier.get_confident_categories(train_docs, test_docs)
+        self.add_categories(dict(zip(test_docs.loc[confident.index, ColumnNames.MERCHANT], confident)))
+
+        remaining = test_docs.drop(index=confident.index)
+        if not remaining.empty:
+            remaining = remaining.assign(category='')
+            categories = ai_get_merchants_categories(remaining, self.ai_config, self.categories)
+            self.attempted.update(remaining[ColumnNames.MERCHANT])
+            self.add_categories({merchant: category for merchant, category in
+                                 zip(remaining[ColumnNames.MERCHANT], categories) if category})
+
+
+@profiling.timed
+def propagate_df_merchant_categories(df, index):
+    return index.propagate_categories(df)
+
+
+@profiling.timed
+def get_merchants_summary_df(index):
+    return index.get_summary_df()
+
+
+@profiling.timed
+def get_merchants_categories(merchant_summary_df, ai_config, categories, on_categories=None, skip_merchants=()):
+    mask = utils.get_df_mask(merchant_summary_df, 'category') & ~merchant_summary_df['merchant'].isin(skip_merchants)
     masked_merchant_summary_df = merchant_summary_df[mask]
+    if on_categories:
+        on_categories(dict(zip(merchant_summary_df.loc[~mask, 'merchant'], merchant_summary_df.loc[~mask, 'category'])))
     if not masked_merchant_summary_df.empty:
         merchant_summary_df.loc[mask, 'category'] = ai_get_merchants_categories(masked_merchant_summary_df,
-                                                                                ai_config,
-                                                                                client)
+                                                                                ai_config, categories, on_categories)
 
     return merchant_summary_df
 
 
-def ai_get_merchants_categories(merchant_summary_df, ai_config, client):
-
-    chunks = utils.get_df_chunks(merchant_summary_df, ai_config.CHUNK_SIZE)
-
-    for chunk in chunks:
-        max_tokens = len(chunk) * 10
-        query = ai_queries.get_categories_query(chunk)
-        response_str = utils_ai.query_ai(query, ai_config, client, max_tokens=max_tokens)
-        chunk_df = utils.extract_df_from_str(response_str)
-        chunk_df = chunk_df.dropna(subset=['category'])
-        if not chunk_df.empty:
-            merchant_summary_df = merchant_summary_df.merge(chunk_df[['merchant', 'category']],
-                                                            on='merchant',
-                                                            how='left',
-                                                            suffixes=('', '_updated'))
-            condition = merchant_summary_df['category_updated'].notna()
-            merchant_summary_df.loc[condition, 'category'] = merchant_summary_df.loc[condition, 'category_updated']
-            merchant_summary_df.drop(columns=['category_updated'], inplace=True)
-
-    return merchant_summary_df['category'].tolist()
-
+def ai_get_merchants_categories(merchant_summary_df, ai_config, categories, on_chunk=None):
 
-def populate_categories(df, merchants_summary_df):
-    df = df.merge(merchants_summary_df[['merchant', 'category']], on='merchant', how='left', suffixes=('', '_updated'))
-    mask = utils.get_df_mask(df, ColumnNames.CATEGORY)
-    if df['category'].dtype != df['category_updated'].dtype:
-        df['category_updated'] = df['category_updated'].astype(df['category'].dtype)
-    df.loc[mask, 'category'] = df.loc[mask, 'category_updated']
-    df.drop(columns=['category_updated'], inplace=True)
-    return df
+    merchant_categories = {}
 
+    for start in range(0, len(merchant_summary_df), ai_config.CHUNK_SIZE):
+        chunk_df = merchant_summary_df.iloc[start:start + ai_config.CHUNK_SIZE]
+        max_tokens = len(chunk_df) * 10
+        query = ai_queries.get_compact_categories_query(prompt_encoder.encode_merchant_summary(chunk_df), categories)
+        prompt_encoder.report_prompt_size(
+            'categories', lambda: ai_queries.get_categories_query(chunk_df.to_csv(index=False), categories), query)
+        response_str = utils_ai.query_ai(query, ai_config, max_tokens=max_tokens)
+        chunk_categories = {merchant: category for merchant, category in
+                            zip(chunk_df['merchant'], prompt_encoder.decode_rows(response_str, len(chunk_df)))
+                            if category}
+        merchant_categories.update(chunk_categories)
+        if on_chunk:
+            on_chunk(chunk_categories)
 
-def ai_get_merchants_from_text(texts_list, ai_config, client):
+    categories = merchant_summary_df['merchant'].map(merchant_categories).fillna(merchant_summary_df['category'])
+    return categories.tolist()
 
-    all_merchants = []
 
-    chunks = utils.get_list_chunks(texts_list, ai_config.CHUNK_SIZE)
+def populate_categories(df, merchants_summary_df, index):
+    merchant_categories = dict(zip(merchants_summary_df['merchant'], merchants_summary_df['category']))
+    return index.populate_categories(df, merchant_categories)
 
-    for chunk in chunks:
 
-        merchants = get_merchant_chunk(chunk, ai_config, client)
-        all_merchants.extend(merchants)
+def clean_merchant_names(merchants):
+    merchants = [merchant.lower().strip().replace(',', '').replace("'", '') for merchant in merchants]
+    return [merchant.split(' gmbh')[0] for merchant in merchants]
 
-    logging.info("ai merchant extraction completed.")
 
-    return all_merchants
+def standardize_merchants(df, ai_config):
+    merchants = df[ColumnNames.MERCHANT].fillna('').astype(str)
+    lowercase = merchants == merchants.str.lower()
+    merchant_names, ambiguous = merchant_clusters.cluster_merchants(merchants[lowercase])
+    ai_names = dict(zip(ambiguous, ai_standardize_merchant_names(ambiguous, ai_config)))
+    merchant_names = {merchant: ai_names.get(name, name) for merchant, name in merchant_names.items()}
 
+    df.loc[lowercase, ColumnNames.MERCHANT] = merchants[lowercase].map(merchant_names).fillna('')
+    return merchant_names
 
-def standardize_merchant_names(merchants):
-    merchants = [merchant.lower().strip().replace(',', '').replace("'", '') for merchant in merchants]
-    merchants = [merchant.split(' gmbh')[0] for merchant in merchants]
-    for n in range(1, 5):
-        n_worded_strs = {merchant.lower() for merchant in merchants if len(merchant.split()) == n}
-        for s in n_worded_strs:
-            for i, merchant in enumerate(merchants):
-                if merchant.lower().startswith(s):
-                    merchants[i] = s
-    return merchants
 
-
-def standardize_merchant_chunk(chunk, ai_config, client):
+def standardize_merchant_chunk(chunk, ai_config):
     max_tokens = len(chunk) * 15
-    query = ai_queries.get_standardize_merchants_query(chunk)
-    standardized_merchants_str = utils_ai.query_ai(query, ai_config, client, max_tokens)
-    standardized_merchants_dict = utils.get_dict_from_string(standardized_merchants_str)
+    rows = prompt_encoder.encode_rows([merchant] for merchant in chunk)
+    query = ai_queries.get_compact_standardize_merchants_query(rows)
+    prompt_encoder.report_prompt_size('standardize', lambda: ai_queries.get_standardize_merchants_query(chunk),
+                                     query)
+    standardized_merchants_str = utils_ai.query_ai(query, ai_config, max_tokens)
+    standardized_merchants = prompt_encoder.decode_rows(standardized_merchants_str, len(chunk))
+    standardized_merchants_dict = {merchant: name for merchant, name in zip(chunk, standardized_merchants) if name}
     return standardized_merchants_dict
 
 
-def ai_standardize_merchant_names(merchants, ai_config, client):
-    merchants_set_list = sorted(list(set(merchants)))
+def ai_standardize_merchant_names(merchants, ai_config, standardized_merchants_dict=None):
+    standardized_merchants_dict = {} if standardized_merchants_dict is None else standardized_merchants_dict
+    merchants_set_list = sorted(set(merchants) - set(standardized_merchants_dict))
     merchants_set_list = [item for item in merchants_set_list if not re.search(r'[A-Z]', item) and item]
 
     chunks = utils.get_list_chunks(merchants_set_list, ai_config.CHUNK_SIZE)
-    standardized_merchants_dict = {}
 
     for chunk in chunks:
-        standardized_merchants_dict.update(standardize_merchant_chunk(chunk, ai_config, client))
+        standardized_merchants_dict.update({merchant: merchant for merchant in chunk})
+        standardized_merchants_dict.update(standardize_merchant_chunk(chunk, ai_config))
 
     standardized_merchants = [standardized_merchants_dict[merchant]
                               if merchant in standardized_merchants_dict else merchant for merchant in merchants]
     return standardized_merchants
 
 
-def get_merchant_chunk(chunk, ai_config, client):
-    max_tokens = len(chunk) * 15
-    query = ai_queries.get_merchants_query(chunk)
-    merchants_str = utils_ai.query_ai(query, ai_config, client, max_tokens)
-    merchants = merchants_str.strip().splitlines()
-
-    # merchants = [re.sub(r'^[\d.-]*\s*|\*+$', '', merchant) for merchant in merchants]
-    merchants = [re.sub(r'^\d+\.\s*|\*+', '', merchant) for merchant in merchants]
-    merchants = delete_merchants_from_chunk(merchants)
-
-    if len(merchants) != len(chunk):
-        logging.warning(f"Merchant-Chunk length mismatch: {len(merchants)} vs {len(chunk)} - some empty.")
-        merchants = manually_match_merchants_and_chunk(merchants, chunk)
-        log_mismatch_to_txt(chunk, merchants)
-
-    return merchants
-
-
-def delete_merchants_from_chunk(merchants):
-    merchants = [item for item in merchants if len(item.split()) < Globals.MERCHANTS_MAX_WORDS]
-    merchants = [item for item in merchants if item != '']
-    return merchants
-
-
-def manually_match_merchants_and_chunk(merchants, chunk):
+def get_merchant_chunk(chunk, ai_config):
+    unique_texts = list(dict.fromkeys(chunk))
+    max_tokens = len(unique_texts) * 15
+    query = ai_queries.get_compact_merchants_query(prompt_encoder.encode_rows([text] for text in unique_texts))
+    prompt_encoder.report_prompt_size('merchants', lambda: ai_queries.get_merchants_query(chunk), query)
+    merchants_str = utils_ai.query_ai(query, ai_config, max_tokens)
+    merchants = prompt_encoder.decode_rows(merchants_str, len(unique_texts))
+    merchants = [merchant if len(merchant.split()) < Globals.MERCHANTS_MAX_WORDS else '' for merchant in merchants]
 
-    matched_merchants = []
-    for text in chunk:
-        found = False
-        for merchant in merchants:
-            if merchant in text:
-                matched_merchants.append(merchant)
-                found = True
-                break
-        if not found:
-            matched_merchants.append('')
+    if '' in merchants:
+        logging.warning(f"Merchant answers missing for {merchants.count('')} of {len(unique_texts)} texts.")
+        log_mismatch_to_txt(unique_texts, merchants)
 
-    return matched_merchants
+    text_merchants = dict(zip(unique_texts, merchants))
+    return [text_merchants[text] for text in chunk]
 
 
 def log_mismatch_to_txt(chunk, merchants):
@@ -0,0 +1,119 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from constants import Globals, ProfilingSettings
+
+_dump_lock = threading.Lock()
+
+
+@contextmanager
+def stage_timer(stage):
+    if not Globals.DEBUG:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def timed(func):
+    if not Globals.DEBUG:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage_timer(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def record_stage(stage, seconds):
+    logging.debug(f"Stage '{stage}' took {seconds * 1000:.1f} ms.")
+    if get_script_run_ctx(suppress_warning=True) is None:
+        dump_timings('worker', {stage: seconds})
+        return
+    timings = st.session_state.setdefault('rerun_timings', {})
+    timings[stage] = timings.get(stage, 0) + seconds
+
+
+def add_to_history(timings, run):
+    history = st.session_state.setdefault('rerun_history', deque(maxlen=ProfilingSettings.HISTORY_SIZE))
+    history.append({'run': run, **timings})
+    dump_timings(run, timings)
+
+
+def start_rerun():
+    if not Globals.DEBUG:
+        return
+    partial_timings = st.session_state.pop('rerun_timings', None)
+    if partial_timings:
+        add_to_history(partial_timings, 'partial')
+    stale_profiler = st.session_state.pop('rerun_profiler', None)
+    if stale_profiler is not None:
+        stale_profiler.disable()
+    st.session_state.rerun_timings = {}
+    st.session_state.rerun_start = time.perf_counter()
+    if st.session_state.pop('profile_next_rerun', False):
+        st.session_state.rerun_profiler = cProfile.Profile()
+        st.session_state.rerun_profiler.enable()
+
+
+def end_rerun():
+    if not Globals.DEBUG:
+        return
+    timings = st.session_state.pop('rerun_timings', {})
+    timings['total'] = time.perf_counter() - st.session_state.pop('rerun_start', time.perf_counter())
+    add_to_history(timings, 'full')
+
+    profiler = st.session_state.pop('rerun_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        st.session_state.rerun_profile = save_profile(profiler)
+
+
+def dump_timings(run, timings):
+    os.makedirs(os.path.dirname(ProfilingSettings.DUMP_PATH), exist_ok=True)
+    entry = {'time': time.time(), 'run': run, **{stage: round(seconds, 4) for stage, seconds in timings.items()}}
+    with _dump_lock, open(ProfilingSettings.DUMP_PATH, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def save_profile(profiler):
+    os.makedirs(ProfilingSettings.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(ProfilingSettings.PROFILE_DIR, f'rerun_{int(time.time())}.prof')
+    profiler.dump_stats(path)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(ProfilingSettings.TOP_FUNCTIONS)
+    return path, stream.getvalue()
+
+
+def request_profile():
+    st.session_state.profile_next_rerun = True
+
+
+def display_profiling():
+    if not Globals.DEBUG:
+        return
+    with st.sidebar.expander("Rerun timings"):
+        history = list(st.session_state.get('rerun_history', []))
+        if history:
+            st.dataframe([{stage: value if stage == 'run' else round(value * 1000, 1)
+                           for stage, value in timings.items()} for timings in reversed(history)], hide_index=True)
+            st.caption("Milliseconds per stage, latest rerun first.")
+        st.button("Profile next rerun", on_click=request_profile)
+        if 'rerun_profile' in st.session_state:
+            path, stats = st.session_state.rerun_profile
+            st.caption(f"Saved to {path}")
+            st.code(stats)
@@ -0,0 +1,66 @@
+import logging
+import re
+import threading
+from constants import Globals, PromptSettings
+
+_stats_lock = threading.Lock()
+_prompt_stats = {}
+
+
+def to_row_id(position):
+    alphabet = PromptSettings.ID_ALPHABET
+    row_id = alphabet[position % len(alphabet)]
+    while position >= len(alphabet):
+        position = position // len(alphabet) - 1
+        row_id = alphabet[position % len(alphabet)] + row_id
+    return row_id
+
+
+def clean_field(value):
+    return re.sub(r'\s+', ' ', str(value).replace(PromptSettings.FIELD_SEPARATOR, ' ')).strip()
+
+
+def encode_rows(rows):
+    separator = PromptSettings.FIELD_SEPARATOR
+    return '\n'.join(separator.join([to_row_id(position)] + [clean_field(field) for field in fields])
+                     for position, fields in enumerate(rows))
+
+
+def format_amount(amount):
+    return f'{float(amount):.{PromptSettings.AMOUNT_DECIMALS}f}'
+
+
+def encode_merchant_summary(summary_df):
+    return encode_rows(zip(summary_df['merchant'], map(format_amount, summary_df['avg_amount'])))
+
+
+def decode_rows(response, num_rows):
+    positions = {to_row_id(position): position for position in range(num_rows)}
+    values = [''] * num_rows
+    for line in response.strip().splitlines():
+        row_id, separator, value = line.strip().strip('`*').partition(PromptSettings.FIELD_SEPARATOR)
+        position = positions.get(row_id.strip().lower())
+        if separator and position is not None:
+            values[position] = re.sub(r'\*+', '', value).strip()
+    return values
+
+
+def estimate_tokens(text):
+    return len(re.findall(r'\w+|[^\w\s]', text))
+
+
+def report_prompt_size(kind, get_baseline_query, query):
+    if not Globals.DEBUG:
+        return
+    baseline, compact = estimate_tokens(get_baseline_query()), estimate_tokens(query)
+    logging.debug(f"Prompt '{kind}': ~{compact} tokens instead of ~{baseline}.")
+    with _stats_lock:
+        stats = _prompt_stats.setdefault(kind, {'prompts': 0, 'baseline': 0, 'compact': 0})
+        stats['prompts'] += 1
+        stats['baseline'] += baseline
+        stats['compact'] += compact
+
+
+def get_prompt_stats():
+    with _stats_lock:
+        return {kind: dict(stats) for kind, stats in _prompt_stats.items()}
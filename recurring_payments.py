@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+from constants import ColumnNames, RecurringSettings
+from merchant_index import clean_merchants
+import utils
+import profiling
+
+
+def get_sorted_charges(df):
+    merchant_codes, merchants = pd.factorize(clean_merchants(df[ColumnNames.MERCHANT]))
+    dates = utils.get_date_col_as_datetime(df).to_numpy().astype('datetime64[D]')
+    days = dates.astype(np.int64)
+    amounts = df[ColumnNames.AMOUNT].to_numpy(dtype=float)
+
+    valid = (np.asarray(merchants, dtype=object)[merchant_codes] != '') & ~np.isnat(dates)
+    merchant_codes, days, amounts = merchant_codes[valid], days[valid], amounts[valid]
+    order = np.lexsort((days, merchant_codes))
+    return merchant_codes[order], days[order], amounts[order], pd.Index(merchants)
+
+
+def get_intervals(merchant_codes, days):
+    intervals = np.diff(days)
+    valid = (merchant_codes[1:] == merchant_codes[:-1]) & (intervals > 0)
+    return merchant_codes[1:][valid], intervals[valid]
+
+
+def get_periodicity_scores(interval_codes, intervals, num_merchants):
+    num_intervals = np.bincount(interval_codes, minlength=num_merchants)
+    scores = np.column_stack([
+        np.bincount(interval_codes, weights=np.abs(intervals - days) <= RecurringSettings.TOLERANCE_DAYS[period],
+                    minlength=num_merchants)
+        for period, days in RecurringSettings.PERIOD_DAYS.items()])
+    return scores / np.maximum(num_intervals, 1)[:, None]
+
+
+def get_amount_stability(merchant_codes, amounts, num_merchants):
+    counts = np.maximum(np.bincount(merchant_codes, minlength=num_merchants), 1)
+    means = np.bincount(merchant_codes, weights=amounts, minlength=num_merchants) / counts
+    squares = np.bincount(merchant_codes, weights=amounts ** 2, minlength=num_merchants) / counts
+    stds = np.sqrt(np.maximum(squares - means ** 2, 0))
+    variation = np.divide(stds, np.abs(means), out=np.ones(num_merchants), where=means != 0)
+    return means, 1 - np.clip(variation, 0, 1)
+
+
+def project_next_dates(last_dates, periods):
+    next_dates = pd.Series(pd.NaT, index=last_dates.index, dtype='datetime64[ns]')
+    for period, offset in RecurringSettings.PERIOD_OFFSETS.items():
+        mask = periods == period
+        if mask.any():
+            next_dates[mask] = pd.DatetimeIndex(last_dates[mask]) + pd.DateOffset(**offset)
+    return next_dates
+
+
+@profiling.timed
+def detect_recurring_payments(df):
+    merchant_codes, days, amounts, merchants = get_sorted_charges(df)
+    num_merchants = len(merchants)
+    if not num_merchants:
+        return pd.DataFrame(columns=['merchant', 'period', 'occurrences', 'avg_amount', 'monthly_cost',
+                                     'periodicity', 'amount_stability', 'last_charge', 'next_charge'])
+
+    interval_codes, intervals = get_intervals(merchant_codes, days)
+    scores = get_periodicity_scores(interval_codes, intervals, num_merchants)
+    periodicity = scores.max(axis=1)
+    periods = np.array(list(RecurringSettings.PERIOD_DAYS))[scores.argmax(axis=1)]
+    avg_amounts, amount_stability = get_amount_stability(merchant_codes, amounts, num_merchants)
+
+    occurrences = np.bincount(merchant_codes, minlength=num_merchants)
+    last_days = np.full(num_merchants, np.iinfo(np.int64).min)
+    np.maximum.at(last_days, merchant_codes, days)
+
+    recurring = ((occurrences >= RecurringSettings.MIN_OCCURRENCES) &
+                 (periodicity >= RecurringSettings.MIN_PERIODICITY) &
+                 (amount_stability >= RecurringSettings.MIN_AMOUNT_STABILITY))
+
+    recurring_df = pd.DataFrame({'merchant': merchants[recurring],
+                                 'period': periods[recurring],
+                                 'occurrences': occurrences[recurring],
+                                 'avg_amount': avg_amounts[recurring],
+                                 'periodicity': periodicity[recurring],
+                                 'amount_stability': amount_stability[recurring],
+                                 'last_charge': last_days[recurring].astype('datetime64[D]').astype('datetime64[ns]')})
+    recurring_df['monthly_cost'] = recurring_df['avg_amount'] * recurring_df['period'].map(
+        RecurringSettings.MONTHLY_FACTORS)
+    recurring_df['next_charge'] = project_next_dates(recurring_df['last_charge'], recurring_df['period'])
+    return recurring_df.sort_values('monthly_cost', ascending=False).reset_index(drop=True)
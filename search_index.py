@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+import pandas as pd
+import streamlit as st
+from constants import ColumnNames, SearchSettings
+import utils
+import profiling
+
+
+def get_docs(df):
+    merchants = df[ColumnNames.MERCHANT].fillna('').astype(str)
+    texts = df[ColumnNames.TEXT].fillna('').astype(str)
+    return (merchants + ' ' + texts).str.lower()
+
+
+def get_query_keys(token, n=SearchSettings.NGRAM_SIZE):
+    return {utils.pack_ngram(token[start:start + n])
+            for start in range(min(len(token), SearchSettings.MAX_CHARS) - n + 1)}
+
+
+class Postings:
+    """Sorted n-gram keys with the ids of the documents containing each of them."""
+
+    def __init__(self, docs, first_id=0):
+        starts = range(0, len(docs), SearchSettings.BATCH_SIZE)
+        parts = [utils.get_char_ngrams(docs[start:start + SearchSettings.BATCH_SIZE], SearchSettings.NGRAM_SIZE,
+                                       SearchSettings.MAX_CHARS, distinct=True) for start in starts]
+        doc_ids = np.concatenate([ids + start for (ids, _), start in zip(parts, starts)] or [[]])
+        keys = np.concatenate([keys for _, keys in parts] or [[]]).astype(np.int64)
+
+        order = np.argsort(keys, kind='stable')
+        self.keys, self.starts = np.unique(keys[order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(order))
+        self.doc_ids = (doc_ids[order] + first_id).astype(np.int32)
+
+    def get(self, key):
+        position = np.searchsorted(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return self.doc_ids[:0]
+        return self.doc_ids[self.starts[position]:self.ends[position]]
+
+    def get_memory_usage(self):
+        return sum(array.nbytes for array in (self.keys, self.starts, self.ends, self.doc_ids))
+
+
+class SearchIndex:
+    """Trigram inverted index over the distinct merchant and text strings of the transactions."""
+
+    @profiling.timed
+    def __init__(self, df):
+        row_docs = get_docs(df)
+        doc_codes, docs = pd.factorize(row_docs)
+        self.docs = pd.Index(docs)
+        self.row_codes = pd.Series(doc_codes, index=df.index)
+        self.postings = Postings(self.docs.to_numpy())
+        self.delta_start = len(self.docs)
+        self.delta = Postings(np.array([], dtype=object), self.delta_start)
+        self.version = utils.get_data_version()
+
+    def update_rows(self, df, labels):
+        labels = pd.Index(labels).unique()
+        present = labels.intersection(df.index)
+        row_docs = get_docs(df.loc[present]).to_numpy()
+
+        new_docs = pd.Index(pd.unique(row_docs[self.docs.get_indexer(row_docs) < 0]))
+        if len(new_docs):
+            self.docs = self.docs.append(new_docs)
+            if len(self.docs) - self.delta_start > SearchSettings.MAX_DELTA_DOCS:
+                self.__init__(df)
+                return
+            self.delta = Postings(self.docs[self.delta_start:].to_numpy(), self.delta_start)
+
+        codes = pd.Series(self.docs.get_indexer(row_docs), index=present)
+        self.row_codes = pd.concat([self.row_codes.drop(labels.intersection(self.row_codes.index)), codes])
+
+    def get_candidates(self, tokens):
+        keys = set().union(*(get_query_keys(token) for token in tokens))
+        if not keys:
+            return np.arange(len(self.docs))
+
+        candidates = None
+        for postings in sorted(([self.postings.get(key), self.delta.get(key)] for key in keys),
+                               key=lambda pair: len(pair[0]) + len(pair[1])):
+            doc_ids = np.concatenate(postings)
+            candidates = doc_ids if candidates is None else np.intersect1d(candidates, doc_ids, assume_unique=True)
+            if not len(candidates):
+                break
+        return candidates
+
+    @profiling.timed
+    def search(self, query):
+        tokens = query.lower().split()
+        candidates = self.get_candidates(tokens)
+        matches = np.ones(len(candidates), dtype=bool)
+        unverified = [token for token in tokens if len(token) != SearchSettings.NGRAM_SIZE]
+        if unverified and len(candidates):
+            docs = pd.Series(self.docs[candidates], dtype=object)
+            for token in unverified:
+                matches &= docs.str.contains(token, regex=False).to_numpy()
+
+        doc_mask = np.zeros(len(self.docs), dtype=bool)
+        doc_mask[candidates[matches]] = True
+        labels = self.row_codes.index[doc_mask[self.row_codes.to_numpy()]]
+        logging.debug(f"Search '{query}' matched {len(labels)} rows from {len(candidates)} candidate texts.")
+        return labels
+
+    def get_memory_usage(self):
+        return (self.postings.get_memory_usage() + self.delta.get_memory_usage() +
+                int(self.row_codes.memory_usage()) + int(self.docs.memory_usage(deep=True)))
+
+
+def is_current():
+    return st.session_state.get('search_index') is not None and \
+        st.session_state.search_index.version == utils.get_data_version()
+
+
+def get_search_index(df):
+    if not is_current():
+        st.session_state.search_index = SearchIndex(df)
+    return st.session_state.search_index
+
+
+def sync_rows(df, touched_labels, was_current):
+    if was_current:
+        index = st.session_state.search_index
+        index.update_rows(df, touched_labels)
+        index.version = utils.get_data_version()
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from constants import MemorySettings
+import utils
+import figure_cache
+
+_lock = threading.Lock()
+_session_footprints = {}
+_frame_sizes = {}
+
+
+def get_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else 'local'
+
+
+def get_frame_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, list):
+        return sum(get_frame_size(item) for item in value)
+    if hasattr(value, 'get_memory_usage'):
+        return value.get_memory_usage()
+    return 0
+
+
+def get_session_footprint():
+    version = utils.get_data_version()
+    with _lock:
+        sizes = _frame_sizes.setdefault(get_session_id(), {})
+    total = 0
+    for key, value in list(st.session_state.items()):
+        if isinstance(value, (pd.DataFrame, list)) or hasattr(value, 'get_memory_usage'):
+            cached = sizes.get(key)
+            if cached is None or cached[0] != version or isinstance(value, figure_cache.FigureCache):
+                cached = sizes[key] = (version, get_frame_size(value))
+            total += cached[1]
+    return total
+
+
+def evict_caches(footprint, budget):
+    if footprint > budget and 'figure_cache' in st.session_state:
+        footprint -= st.session_state.figure_cache.get_memory_usage()
+        st.session_state.figure_cache.clear()
+        logging.info(f"Cleared the figure cache of session {get_session_id()}.")
+
+    if footprint > budget and 'search_index' in st.session_state and not st.session_state.get('search_query'):
+        footprint -= st.session_state.search_index.get_memory_usage()
+        del st.session_state.search_index
+        logging.info(f"Dropped the search index of session {get_session_id()}.")
+    return footprint
+
+
+def enforce_memory_budget():
+    # Only rebuildable caches are evicted; the working set (current_df, its merchant index and the store
+    # query) is needed on every rerun, so for it the budget is advisory and only logged.
+    budget = MemorySettings.SESSION_BUDGET_MB * 1e6
+    footprint = evict_caches(get_session_footprint(), budget)
+    if footprint > budget:
+        logging.warning(f"Session {get_session_id()} uses {footprint / 1e6:.1f} MB, "
+                        f"over the {MemorySettings.SESSION_BUDGET_MB} MB budget.")
+    record_session_footprint(footprint)
+    return footprint
+
+
+def record_session_footprint(footprint):
+    now = time.time()
+    with _lock:
+        _session_footprints[get_session_id()] = (footprint, now)
+        expired = [session_id for session_id, (_, last_seen) in _session_footprints.items()
+                   if now - last_seen > MemorySettings.SESSION_TTL_SECONDS]
+        for session_id in expired:
+            del _session_footprints[session_id]
+            _frame_sizes.pop(session_id, None)
+
+
+def get_server_memory_stats():
+    with _lock:
+        footprints = {session_id: footprint for session_id, (footprint, _) in _session_footprints.items()}
+    stats = {'sessions': len(footprints),
+             'total_mb': sum(footprints.values()) / 1e6,
+             'max_session_mb': max(footprints.values(), default=0) / 1e6}
+    try:
+        import resource
+        stats['process_max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    except ImportError:
+        pass
+    return stats
+
+
+def remove_stale_checkboxes(categories):
+    current = {f'checkbox_{category}' for category in categories}
+    for key in [key for key in st.session_state.keys() if key.startswith('checkbox_') and key not in current]:
+        del st.session_state[key]
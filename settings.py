@@ -1,9 +1,11 @@
+import importlib
 import logging
-import os
+import time
 import streamlit as st
-from constants import Globals, Colors
-from openai import OpenAI
-import google.generativeai as genai
+from constants import Globals, Colors, AIClientSettings
+import ai_clients
+
+STARTUP_TIMINGS = {}
 
 
 def set_logger():
@@ -17,6 +19,21 @@ def set_logger():
     return logger
 
 
+def lazy_import(module_name):
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if module_name not in STARTUP_TIMINGS:
+        STARTUP_TIMINGS[module_name] = time.perf_counter() - start
+        logging.debug(f"Imported {module_name} in {STARTUP_TIMINGS[module_name] * 1000:.0f} ms.")
+    return module
+
+
+def log_startup_time(stage, start):
+    if stage not in STARTUP_TIMINGS:
+        STARTUP_TIMINGS[stage] = time.perf_counter() - start
+        logging.info(f"Startup '{stage}' after {STARTUP_TIMINGS[stage] * 1000:.0f} ms.")
+
+
 def set_st():
     st.set_page_config(layout="wide")
     st.title('Expenses Analyzer')
@@ -43,19 +60,33 @@ def set_footer():
 
 
 class OpenAIConfig:
+    NAME = "openai"
     MODEL = "gpt-3.5-turbo-0125"  # "gpt-4o"
     CHUNK_SIZE = 15
+    KEY_FILE = 'openai_key.txt'
 
     @classmethod
-    def set_client(cls):
-        with open(os.path.join('api_keys', 'openai_key.txt'), 'r') as file:
-            openai_key = file.read().strip()
-        return OpenAI(api_key=openai_key)
+    def create_client(cls, api_key):
+        openai = lazy_import('openai')
+        httpx = lazy_import('httpx')
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=AIClientSettings.MAX_CONNECTIONS,
+                                max_keepalive_connections=AIClientSettings.MAX_KEEPALIVE_CONNECTIONS,
+                                keepalive_expiry=AIClientSettings.KEEPALIVE_EXPIRY_SECONDS),
+            timeout=httpx.Timeout(AIClientSettings.TIMEOUT_SECONDS,
+                                  connect=AIClientSettings.CONNECT_TIMEOUT_SECONDS))
+        return openai.OpenAI(api_key=api_key, http_client=http_client, max_retries=AIClientSettings.MAX_RETRIES)
+
+    @classmethod
+    def get_client(cls):
+        return ai_clients.get_ai_client(cls)
 
 
 class GenAIConfig:
-    MODEL = genai.GenerativeModel("gemini-2.5-flash-preview-04-17")
+    NAME = "genai"
+    MODEL = "gemini-2.5-flash-preview-04-17"
     CHUNK_SIZE = 40
+    KEY_FILE = 'gemini_key.txt'
 
     if Globals.DEBUG:
         TEMPERATURE = 0.5
@@ -63,10 +94,14 @@ class GenAIConfig:
         TEMPERATURE = 0.2
 
     @classmethod
-    def set_client(cls):
-        with open(os.path.join('api_keys', 'gemini_key.txt'), 'r') as file:
-            genai_key = file.read().strip()
-        return genai.configure(api_key=genai_key)
+    def create_client(cls, api_key):
+        genai = lazy_import('google.generativeai')
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(cls.MODEL)
+
+    @classmethod
+    def get_client(cls):
+        return ai_clients.get_ai_client(cls)
 
 
 def get_ai_config(name):
@@ -2,57 +2,130 @@ import streamlit as st
 import pandas as pd
 import utils_html
 import utils
-from constants import ColumnNames
+import session_data
+import figure_cache
+import ai_clients
+import prompt_encoder
+import transaction_store
+import search_index
+from constants import ColumnNames, Globals
+import profiling
+
+
+def display_date_filter(df):
+    if transaction_store.is_active():
+        min_date, max_date = transaction_store.query_date_bounds()
+    else:
+        min_date, max_date = get_min_max_date(df)
+    st.sidebar.date_input("Select date range:", [min_date, max_date], key='date_range')
+
+
+@profiling.timed
+def apply_filters(df):
+    if transaction_store.is_active():
+        filtered_df = transaction_store.get_filtered_transactions(st.session_state.get('date_range', ()),
+                                                                  get_unselected_categories())
+    else:
+        filtered_df = apply_date_filter(df)
+        if not filtered_df.empty:
+            filtered_df = apply_category_filter(filtered_df, get_selected_categories())
+    return apply_search_filter(df, filtered_df)
+
+
+def display_search():
+    st.sidebar.text_input("Search transactions", key='search_query', placeholder="Merchant or text")
+
+
+def get_search_query():
+    return st.session_state.get('search_query', '').strip()
+
+
+def apply_search_filter(df, filtered_df):
+    query = get_search_query()
+    if not query or filtered_df.empty:
+        return filtered_df
+    labels = search_index.get_search_index(df).search(query)
+    return filtered_df[filtered_df.index.isin(labels)]
 
 
 def apply_date_filter(df):
-    df = filter_df_by_date_range(df)
+    df = filter_df_by_date_range(df, st.session_state.get('date_range', ()))
     df = df.sort_values(by=ColumnNames.DATE)
     return df
 
 
-def filter_df_by_date_range(df):
-
-    min_date, max_date = get_min_max_date(df)
-    date_range = st.sidebar.date_input("Select date range:", [min_date, max_date])
+def filter_df_by_date_range(df, date_range):
 
     if len(date_range) == 2:
         start_date, end_date = date_range
         start_date = pd.Timestamp(start_date)
         end_date = pd.Timestamp(end_date)
 
-        return df[(utils.get_date_col_as_datetime(df) >= start_date) & (utils.get_date_col_as_datetime(df) <= end_date)]
+        dates = utils.get_date_col_as_datetime(df)
+        return df[(dates >= start_date) & (dates <= end_date)]
     else:
         return df
 
 
+def extend_date_range(dates):
+    date_range = st.session_state.get('date_range', ())
+    dates = utils.get_date_col_as_datetime(pd.DataFrame({ColumnNames.DATE: dates})).dropna()
+    if len(date_range) == 2 and not dates.empty:
+        st.session_state.date_range = (min(date_range[0], dates.min().date()), max(date_range[1], dates.max().date()))
+
+
 def get_min_max_date(df):
     min_date = utils.get_date_col_as_datetime(df).min().date()
     max_date = utils.get_date_col_as_datetime(df).max().date()
     return min_date, max_date
 
 
+def get_filter_key():
+    date_range = tuple(st.session_state.get('date_range', ()))
+    selected = tuple(sorted(key for key, value in st.session_state.items()
+                            if key.startswith('checkbox_') and value is True))
+    return date_range, selected, get_search_query()
+
+
+def get_selected_categories():
+    return {key[len('checkbox_'):]: value for key, value in st.session_state.items() if key.startswith('checkbox_')}
+
+
+def get_unselected_categories(selected_categories=None):
+    selected_categories = get_selected_categories() if selected_categories is None else selected_categories
+    return [category for category, is_selected in selected_categories.items() if not is_selected]
+
+
 def apply_category_filter(df, selected_categories):
-    df = df[df['category'].apply(lambda x: x in selected_categories and selected_categories[x])]
+    df = df[~df[ColumnNames.CATEGORY].isin(get_unselected_categories(selected_categories))]
     return df
 
 
+@profiling.timed
+def get_categories(df):
+    version = utils.get_data_version()
+    if st.session_state.get('sidebar_categories_version') != version:
+        st.session_state.sidebar_categories = df[ColumnNames.CATEGORY].unique().tolist()
+        st.session_state.sidebar_categories_version = version
+        session_data.remove_stale_checkboxes(st.session_state.sidebar_categories)
+    return st.session_state.sidebar_categories
+
+
+def set_all_categories(categories, value):
+    for category in categories:
+        st.session_state[f'checkbox_{category}'] = value
+
+
 def manage_sidebar_categories(df):
-    categories = df[ColumnNames.CATEGORY].unique().tolist()
+    categories = get_categories(df)
     st.markdown(utils_html.custom_css_sidebar(), unsafe_allow_html=True)
     st.sidebar.header("Categories")
     selected_categories = {}
 
     # Buttons for Select All and Unselect All
     col_btn1, col_btn2 = st.sidebar.columns([1, 1])
-    if col_btn1.button('Select All'):
-        for category in categories:
-            st.session_state[f'checkbox_{category}'] = True
-        st.experimental_rerun()
-    if col_btn2.button('None'):
-        for category in categories:
-            st.session_state[f'checkbox_{category}'] = False
-        st.experimental_rerun()
+    col_btn1.button('Select All', on_click=set_all_categories, args=(categories, True))
+    col_btn2.button('None', on_click=set_all_categories, args=(categories, False))
 
     # Display categories with checkboxes and trash icons
     for category in categories:
@@ -67,9 +140,7 @@ def manage_sidebar_categories(df):
             st.session_state[f'checkbox_{category}'] = True  # Default value initialization
 
         # Checkbox for category selection
-        selected_categories[category] = col2.checkbox(category,
-                                                      value=st.session_state[f'checkbox_{category}'],
-                                                      key=f'checkbox_{category}')
+        selected_categories[category] = col2.checkbox(category, key=f'checkbox_{category}')
 
     # new_category = st.sidebar.text_input("Add new category")
     # if st.sidebar.button("Add Category"):
@@ -80,3 +151,30 @@ def manage_sidebar_categories(df):
     #         st.experimental_rerun()
 
     return selected_categories, categories
+
+
+def display_memory_stats(footprint):
+    if Globals.DEBUG:
+        stats = session_data.get_server_memory_stats()
+        st.sidebar.caption(f"Session memory: {footprint / 1e6:.1f} MB · "
+                           f"server: {stats['total_mb']:.1f} MB over {stats['sessions']} sessions")
+        cache_stats = figure_cache.get_stats()
+        if cache_stats:
+            st.sidebar.caption(f"Figure cache: {cache_stats['hit_rate']:.0%} hit rate "
+                               f"({cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                               f"{cache_stats['views']} views, {cache_stats['mb']:.1f} MB)")
+
+
+def display_ai_client_health():
+    if Globals.DEBUG:
+        for name, stats in ai_clients.get_client_health().items():
+            st.sidebar.caption(f"AI client {name}: {stats['requests']} requests, {stats['failures']} failures")
+        for kind, stats in prompt_encoder.get_prompt_stats().items():
+            st.sidebar.caption(f"Prompt tokens ({kind}): ~{stats['compact']} instead of ~{stats['baseline']} "
+                               f"over {stats['prompts']} prompts")
+        st.sidebar.button("Reset AI clients", on_click=ai_clients.reset_ai_clients)
+
+
+def display_store_controls():
+    if transaction_store.is_active():
+        st.sidebar.button("Clear saved transactions", on_click=transaction_store.reset_session)
@@ -0,0 +1,183 @@
+import os
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+import streamlit as st
+from constants import ColumnNames, Globals, StoreSettings
+import utils
+import merchant_index
+
+TABLE = f'''CREATE TABLE IF NOT EXISTS transactions (
+              id INTEGER PRIMARY KEY,
+              {ColumnNames.DATE} TEXT,
+              {ColumnNames.TEXT} TEXT,
+              {ColumnNames.AMOUNT} REAL,
+              {ColumnNames.MERCHANT} TEXT,
+              {ColumnNames.CATEGORY} TEXT)'''
+FINGERPRINTS_TABLE = 'CREATE TABLE IF NOT EXISTS fingerprints (fingerprint INTEGER PRIMARY KEY)'
+INDEXES = {'idx_date': ColumnNames.DATE,
+           'idx_category': f'{ColumnNames.CATEGORY}, {ColumnNames.DATE}',
+           'idx_merchant': ColumnNames.MERCHANT}
+
+
+def create_indexes(connection):
+    for name, columns in INDEXES.items():
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {name} ON transactions ({columns})')
+
+
+def connect(path=StoreSettings.DB_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute(TABLE)
+    connection.execute(FINGERPRINTS_TABLE)
+    create_indexes(connection)
+    return connection
+
+
+def to_sql_dates(dates):
+    return utils.get_date_col_as_datetime(pd.DataFrame({ColumnNames.DATE: dates})).dt.strftime(
+        StoreSettings.SQL_DATE_FORMAT)
+
+
+def to_rows(df):
+    rows = pd.DataFrame({'id': df.index.astype(np.int64),
+                         ColumnNames.DATE: to_sql_dates(df[ColumnNames.DATE]).to_numpy(),
+                         ColumnNames.TEXT: df[ColumnNames.TEXT].to_numpy(),
+                         ColumnNames.AMOUNT: pd.to_numeric(df[ColumnNames.AMOUNT], errors='coerce').to_numpy(),
+                         ColumnNames.MERCHANT: df[ColumnNames.MERCHANT].to_numpy(),
+                         ColumnNames.CATEGORY: df[ColumnNames.CATEGORY].to_numpy()})
+    rows = rows.astype(object).where(rows.notna(), None)
+    return rows.itertuples(index=False, name=None)
+
+
+def from_sql(df):
+    df = df.set_index('id')
+    df.index.name = None
+    dates = pd.to_datetime(df[ColumnNames.DATE], format=StoreSettings.SQL_DATE_FORMAT, errors='coerce')
+    df[ColumnNames.DATE] = dates.dt.strftime(Globals.DATE_FORMAT)
+    return df[ColumnNames.as_list()]
+
+
+def replace_transactions(df):
+    with closing(connect()) as connection, connection:
+        connection.execute('DELETE FROM transactions')
+        for name in INDEXES:
+            connection.execute(f'DROP INDEX IF EXISTS {name}')
+        connection.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?)', to_rows(df))
+        create_indexes(connection)
+
+
+def upsert_transactions(df, deleted_labels=()):
+    with closing(connect()) as connection, connection:
+        connection.executemany('DELETE FROM transactions WHERE id = ?', [(int(label),) for label in deleted_labels])
+        connection.executemany('INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?)', to_rows(df))
+
+
+def clear_transactions():
+    with closing(connect()) as connection, connection:
+        connection.execute('DELETE FROM transactions')
+        connection.execute('DELETE FROM fingerprints')
+
+
+def save_fingerprints(fingerprints, replace=False):
+    with closing(connect()) as connection, connection:
+        if replace:
+            connection.execute('DELETE FROM fingerprints')
+        connection.executemany('INSERT OR IGNORE INTO fingerprints VALUES (?)',
+                               [(int(fingerprint),) for fingerprint in fingerprints])
+
+
+def load_fingerprints():
+    with closing(connect()) as connection:
+        return pd.read_sql_query('SELECT fingerprint FROM fingerprints', connection)['fingerprint']
+
+
+def count_transactions():
+    with closing(connect()) as connection:
+        return connection.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+
+
+def load_transactions():
+    with closing(connect()) as connection:
+        return from_sql(pd.read_sql_query('SELECT * FROM transactions ORDER BY id', connection))
+
+
+def get_filter_clause(date_range, unselected_categories):
+    clauses, params = [], []
+    if len(date_range) == 2:
+        clauses.append(f'{ColumnNames.DATE} BETWEEN ? AND ?')
+        params.extend(pd.Timestamp(date).strftime(StoreSettings.SQL_DATE_FORMAT) for date in date_range)
+
+    if unselected_categories:
+        clauses.append(f'({ColumnNames.CATEGORY} IS NULL OR {ColumnNames.CATEGORY} NOT IN '
+                       f'({", ".join("?" * len(unselected_categories))}))')
+        params.extend(unselected_categories)
+
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def query_transactions(date_range, unselected_categories):
+    where, params = get_filter_clause(date_range, unselected_categories)
+    with closing(connect()) as connection:
+        df = pd.read_sql_query(f'SELECT * FROM transactions{where} ORDER BY {ColumnNames.DATE}, id',
+                               connection, params=params)
+    return from_sql(df)
+
+
+def get_filtered_transactions(date_range, unselected_categories):
+    key = (utils.get_data_version(), tuple(date_range), tuple(sorted(unselected_categories)))
+    if st.session_state.get('store_query_key') != key:
+        st.session_state.store_query_df = query_transactions(date_range, unselected_categories)
+        st.session_state.store_query_key = key
+    return st.session_state.store_query_df.copy()
+
+
+def query_category_totals(date_range, unselected_categories):
+    where, params = get_filter_clause(date_range, unselected_categories)
+    where = where + (' AND ' if where else ' WHERE ') + f'{ColumnNames.CATEGORY} IS NOT NULL'
+    with closing(connect()) as connection:
+        return pd.read_sql_query(f'SELECT {ColumnNames.CATEGORY}, SUM({ColumnNames.AMOUNT}) AS {ColumnNames.AMOUNT} '
+                                 f'FROM transactions{where} GROUP BY {ColumnNames.CATEGORY} '
+                                 f'ORDER BY {ColumnNames.CATEGORY}', connection, params=params)
+
+
+def query_date_bounds():
+    with closing(connect()) as connection:
+        min_date, max_date = connection.execute(
+            f'SELECT MIN({ColumnNames.DATE}), MAX({ColumnNames.DATE}) FROM transactions').fetchone()
+    return pd.Timestamp(min_date).date(), pd.Timestamp(max_date).date()
+
+
+def is_active():
+    return StoreSettings.ENABLED and st.session_state.get('store_version') == utils.get_data_version()
+
+
+def sync_all(df):
+    if StoreSettings.ENABLED:
+        replace_transactions(df)
+        st.session_state.store_version = utils.get_data_version()
+
+
+def sync_rows(df, touched_labels, was_active):
+    if StoreSettings.ENABLED:
+        present = df.index.intersection(touched_labels)
+        upsert_transactions(df.loc[present], pd.Index(touched_labels).difference(present))
+        if was_active:
+            st.session_state.store_version = utils.get_data_version()
+
+
+def restore_session():
+    df = load_transactions()
+    st.session_state.current_df = df
+    merchant_index.build_merchant_index(df)
+    st.session_state.is_ran_ai = True
+    utils.bump_data_version()
+    st.session_state.store_version = utils.get_data_version()
+    return df
+
+
+def reset_session():
+    clear_transactions()
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
@@ -28,7 +28,10 @@ def str_to_float(value):
 
 
 def get_date_col_as_datetime(df, col=ColumnNames.DATE, date_format=Globals.DATE_FORMAT):
-    return pd.to_datetime(df[col], format=date_format, errors='coerce')
+    codes, unique_dates = pd.factorize(df[col])
+    dates = pd.to_datetime(pd.Series(unique_dates), format=date_format, errors='coerce').to_numpy()
+    dates = np.append(dates, np.datetime64('NaT', 'ns'))
+    return pd.Series(dates[codes], index=df.index, name=col)
 
 
 def display_message(color, message):
@@ -85,8 +88,11 @@ def add_new_category(categories_dict, new_category):
 
 def add_categories_to_session_state(df):
     if not df.empty:
+        if st.session_state.get('categories_version') == get_data_version():
+            return
         if not df[ColumnNames.CATEGORY].eq('').all():
             st.session_state.categories = df[df['category'].notna() & (df['category'] != '')]['category'].unique()
+            st.session_state.categories_version = get_data_version()
         elif 'categories' not in st.session_state:
             placeholder = st.empty()
             with placeholder.container():
@@ -101,6 +107,15 @@ def add_categories_to_session_state(df):
                         placeholder.empty()
 
 
+def get_data_version():
+    return st.session_state.get('data_version', 0)
+
+
+def bump_data_version():
+    st.session_state.data_version = get_data_version() + 1
+    return st.session_state.data_version
+
+
 def read_strs_to_del(json_path='json/delete_list.json'):
     with open(json_path, 'r') as json_file:
         to_del_list = json.load(json_file)
@@ -160,3 +175,29 @@ def get_df_mask(df, column_name):
             (df[column_name] == '') |
             (df[column_name] == ','))
     return mask
+
+
+def pack_ngram(chars):
+    key = 0
+    for char in chars:
+        key = (key << 21) | ord(char)
+    return key
+
+
+def get_char_ngrams(strings, n, max_chars, distinct=False):
+    """Return (row position, key) pairs for the character n-grams of each string, 21 bits per code point."""
+    strings = pd.Series(strings, dtype=object).str[:max_chars]
+    width = max(int(strings.str.len().max()) if len(strings) else 0, n)
+    code_points = np.array(strings.tolist(), dtype=f'<U{width}').view(np.uint32).reshape(-1, width).astype(np.int64)
+
+    keys = np.zeros((len(strings), width - n + 1), dtype=np.int64)
+    for offset in range(n):
+        keys = (keys << 21) | code_points[:, offset:width - n + 1 + offset]
+    valid = code_points[:, n - 1:] > 0
+    if distinct:
+        keys[~valid] = -1
+        keys.sort(axis=1)
+        valid = keys >= 0
+        valid[:, 1:] &= keys[:, 1:] != keys[:, :-1]
+    row_ids = np.broadcast_to(np.arange(len(strings))[:, None], keys.shape)
+    return row_ids[valid], keys[valid]
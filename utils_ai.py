@@ -1,17 +1,33 @@
-from settings import OpenAIConfig, GenAIConfig
-import google.generativeai as genai
-from constants import Globals
+from settings import OpenAIConfig, GenAIConfig, lazy_import
+from constants import Globals, AIClientSettings
+import ai_clients
+import job_checkpoints
 import re
 
 
-def query_ai(query, config, client, max_tokens=None):
-    if config is OpenAIConfig:
-        return query_chatgpt(query, client)
-    elif config is GenAIConfig:
-        return query_genai(query, config, max_tokens)
-    else:
+def query_ai(query, config, max_tokens=None):
+    if config not in (OpenAIConfig, GenAIConfig):
         raise ValueError("Invalid AI client.")
 
+    store = job_checkpoints.get_active_store()
+    if store is not None:
+        cached_response = store.get(query, config.NAME)
+        if cached_response is not None:
+            return cached_response
+
+    try:
+        if config is OpenAIConfig:
+            response = query_chatgpt(query, config.get_client())
+        else:
+            response = query_genai(query, config, max_tokens)
+    except Exception as e:
+        ai_clients.report_failure(config, e, AIClientSettings.MAX_CONSECUTIVE_FAILURES)
+        raise
+    ai_clients.report_success(config)
+    if store is not None:
+        store.put(query, config.NAME, response)
+    return response
+
 
 def query_chatgpt(query, client):
     messages = [
@@ -30,10 +46,11 @@ def query_chatgpt(query, client):
 
 def query_genai(query, config, max_tokens):
 
+    genai = lazy_import('google.generativeai')
     generation_config = (genai.types.GenerationConfig(temperature=GenAIConfig.TEMPERATURE))
                          # , max_output_tokens=max_tokens)
 
-    response = config.MODEL.generate_content(query, generation_config=generation_config).text
+    response = config.get_client().generate_content(query, generation_config=generation_config).text
     response = re.sub(r"(\w)'(\w)", r"\1\2", response)
 
     if Globals.DEBUG:
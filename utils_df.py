@@ -1,8 +1,10 @@
 import pandas as pd
 import numpy as np
 import re
-from constants import ColumnNames
+from constants import ColumnNames, PlotSettings
+from merchant_index import clean_categories, clean_merchants
 import utils
+import profiling
 
 
 def add_categories_to_df(df, categories_dict):
@@ -18,11 +20,66 @@ def delete_rows(df, to_del_list):
     return df[~df[ColumnNames.TEXT].str.contains(pattern, case=False, na=False)]
 
 
-def get_monthly_expense_df(df, df_grouped):
-    df['month'] = utils.get_date_col_as_datetime(df).dt.to_period('M').astype(str)
-    monthly_expenses = df.groupby(['month', ColumnNames.CATEGORY])[ColumnNames.AMOUNT].sum().reset_index()
+def get_auto_granularity(df):
+    dates = utils.get_date_col_as_datetime(df)
+    span_days = (dates.max() - dates.min()).days
+    for granularity, max_days in PlotSettings.GRANULARITY_MAX_DAYS.items():
+        if span_days <= max_days:
+            return granularity
+    return 'year'
+
+
+def format_periods(periods, granularity):
+    if granularity == 'week':
+        return periods.dt.start_time.dt.strftime('%Y-%m-%d')
+    return periods.astype(str)
+
+
+@profiling.timed
+def get_period_expense_df(df, df_grouped, granularity):
+    periods = utils.get_date_col_as_datetime(df).dt.to_period(PlotSettings.GRANULARITY_FREQS[granularity])
+    period_expenses = df.groupby([periods.rename('period'), df[ColumnNames.CATEGORY]])[ColumnNames.AMOUNT].sum()
+    period_expenses = period_expenses.reset_index()
+    period_expenses['period'] = format_periods(period_expenses['period'], granularity)
     category_order = df_grouped.sort_values(by=ColumnNames.AMOUNT, ascending=False)[ColumnNames.CATEGORY].tolist()
-    monthly_expenses[ColumnNames.CATEGORY] = pd.Categorical(monthly_expenses[ColumnNames.CATEGORY],
-                                                            categories=category_order,
-                                                            ordered=True)
-    return monthly_expenses
+    period_expenses[ColumnNames.CATEGORY] = pd.Categorical(period_expenses[ColumnNames.CATEGORY],
+                                                           categories=category_order,
+                                                           ordered=True)
+    return period_expenses
+
+
+def rank_merchants_by_amount(totals_df):
+    totals_df = totals_df[totals_df[ColumnNames.AMOUNT] > 0]
+    totals_df = totals_df.sort_values([ColumnNames.CATEGORY, ColumnNames.AMOUNT], ascending=[True, False])
+    return totals_df, totals_df.groupby(ColumnNames.CATEGORY).cumcount()
+
+
+@profiling.timed
+def get_category_merchant_totals(df):
+    merchant_codes, merchant_names = pd.factorize(clean_merchants(df[ColumnNames.MERCHANT]))
+    category_codes, category_names = pd.factorize(clean_categories(df[ColumnNames.CATEGORY]))
+    num_merchants = max(len(merchant_names), 1)
+    keys = category_codes.astype(np.int64) * num_merchants + merchant_codes
+    key_codes, unique_keys = pd.factorize(keys)
+    totals = np.bincount(key_codes, weights=df[ColumnNames.AMOUNT].to_numpy(dtype=float))
+
+    totals_df = pd.DataFrame({ColumnNames.CATEGORY: np.asarray(category_names)[unique_keys // num_merchants],
+                              ColumnNames.MERCHANT: np.asarray(merchant_names)[unique_keys % num_merchants],
+                              ColumnNames.AMOUNT: totals})
+    return totals_df
+
+
+@profiling.timed
+def get_top_merchants_df(totals_df, top_n=PlotSettings.SUNBURST_TOP_N):
+    totals_df, rank = rank_merchants_by_amount(totals_df)
+    other_df = totals_df[rank >= top_n].groupby(ColumnNames.CATEGORY, as_index=False).agg(
+        **{ColumnNames.AMOUNT: (ColumnNames.AMOUNT, 'sum'), 'num_merchants': (ColumnNames.MERCHANT, 'size')})
+    other_df[ColumnNames.MERCHANT] = (f'{PlotSettings.OTHER_LABEL} (' +
+                                      other_df['num_merchants'].astype(str) + ' merchants)')
+    top_df = pd.concat([totals_df[rank < top_n], other_df.drop(columns='num_merchants')], ignore_index=True)
+    return top_df, other_df[ColumnNames.CATEGORY].tolist()
+
+
+def get_other_merchants_df(totals_df, top_n=PlotSettings.SUNBURST_TOP_N):
+    totals_df, rank = rank_merchants_by_amount(totals_df)
+    return totals_df[rank >= top_n].reset_index(drop=True)
@@ -1,5 +1,12 @@
+import gzip
+import os
+import tempfile
 import streamlit as st
 import pandas as pd
+from constants import ExportSettings
+import sidebar
+import utils
+import profiling
 
 
 def upload_csvs_to_dfs():
@@ -12,13 +19,15 @@ def upload_csvs_to_dfs():
                                      accept_multiple_files=True, type=['csv'])
 
         if csv_files:
+            all_dfs = []
             for f in csv_files:
                 try:
                     df = pd.read_csv(f)
-                    st.session_state.all_dfs.append(df)
+                    all_dfs.append(df)
                     st.session_state.uploaded_files.append(f.name)
                 except Exception as e:
                     st.error(f"Error processing {f.name}: {e}")
+            st.session_state.all_dfs = all_dfs
             st.session_state.is_uploaded = True
             st.rerun()
 
@@ -32,17 +41,86 @@ def upload_csvs_to_dfs():
     return st.session_state.all_dfs
 
 
+def upload_additional_csvs():
+    uploader_key = f"append_uploader_{st.session_state.get('append_uploads', 0)}"
+    csv_files = st.sidebar.file_uploader("Add new statements", accept_multiple_files=True, type=['csv'],
+                                         key=uploader_key)
+    all_dfs = []
+    for f in csv_files or []:
+        try:
+            f.seek(0)
+            all_dfs.append(pd.read_csv(f))
+        except Exception as e:
+            st.sidebar.error(f"Error processing {f.name}: {e}")
+    return all_dfs
+
+
 def set_upload_csv_state():
     st.session_state.is_uploaded = False
     st.session_state.all_dfs = []
     st.session_state.uploaded_files = []
 
 
-def save_df_to_csv(df):
-    csv = df.to_csv(index=False).encode('utf-8')
-    st.download_button(label="Download current CSV",
-                       data=csv,
-                       file_name='expenses_formated.csv',
-                       mime='text/csv')
+@profiling.timed
+def save_df(df):
+    col1, col2 = st.columns([1, 3])
+    export_format = col1.selectbox("Download format", list(ExportSettings.FORMATS), key='export_format')
+    export_key = (utils.get_data_version(), sidebar.get_filter_key(), export_format)
+
+    if col2.button("Prepare download"):
+        st.session_state.requested_export_key = export_key
+
+    if st.session_state.get('requested_export_key') == export_key:
+        extension, mime = ExportSettings.FORMATS[export_format]
+        st.download_button(label=f"Download current {export_format}",
+                           data=get_export_data(df, export_key),
+                           file_name=f'{ExportSettings.FILE_NAME}.{extension}',
+                           mime=mime)
     st.warning('''Save your work by downloading the CSV  
                 Make sure you don't select unwanted filters!''')
+
+
+def get_export_data(df, export_key):
+    cached = st.session_state.get('export_data')
+    if cached is None or cached[0] != export_key:
+        st.session_state.pop('export_data', None)
+        export_format = export_key[-1]
+        extension, _ = ExportSettings.FORMATS[export_format]
+        with tempfile.TemporaryDirectory(prefix='expenses_export_') as export_dir:
+            path = os.path.join(export_dir, f'export.{extension}')
+            write_export_file(df, path, export_format)
+            with open(path, 'rb') as f:
+                cached = (export_key, f.read())
+        st.session_state.export_data = cached
+    return cached[1]
+
+
+def get_df_row_chunks(df, chunk_rows=ExportSettings.CHUNK_ROWS):
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield start, df.iloc[start:start + chunk_rows]
+
+
+def write_export_file(df, path, export_format):
+    if export_format == 'Parquet':
+        write_parquet_in_chunks(df, path)
+    else:
+        open_func = gzip.open if export_format == 'Compressed CSV' else open
+        with open_func(path, 'wt', encoding='utf-8', newline='') as f:
+            for start, chunk in get_df_row_chunks(df):
+                chunk.to_csv(f, header=start == 0, index=False)
+
+
+def write_parquet_in_chunks(df, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for _, chunk in get_df_row_chunks(df):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()